@@ -0,0 +1,206 @@
+import os
+import time
+import uuid
+import base64
+import threading
+from collections import OrderedDict
+import cv2
+
+# Overlay images kept per request. The cap counts encoded bytes, or the source
+# array for overlays nobody has fetched yet.
+ARTIFACT_MAX_BYTES = int(os.getenv('ARTIFACT_MAX_BYTES', str(64 * 1024 * 1024)))
+ARTIFACT_TTL_SECONDS = float(os.getenv('ARTIFACT_TTL_SECONDS', '600'))
+# 'png' keeps the old lossless output; 'jpeg' encodes several times faster and smaller
+ARTIFACT_FORMAT = os.getenv('ARTIFACT_FORMAT', 'png')
+ARTIFACT_JPEG_QUALITY = int(os.getenv('ARTIFACT_JPEG_QUALITY', '85'))
+# 'url' hands out an /outputs link; 'inline' embeds a base64 data URI in the JSON
+ARTIFACT_MODE = os.getenv('ARTIFACT_MODE', 'url')
+# Pre-forked workers (gunicorn.conf.py) do not share memory, and the /outputs fetch may
+# reach another worker. With a shared directory overlays are rendered when created and
+# written there instead; files past the TTL are swept.
+ARTIFACT_SHARED_DIR = os.getenv('ARTIFACT_SHARED_DIR')
+
+FORMATS = {
+    'png': ('.png', 'image/png'),
+    'jpeg': ('.jpg', 'image/jpeg')
+}
+
+
+def encode_image(rgb, fmt=ARTIFACT_FORMAT):
+    """PNG or JPEG bytes of an RGB uint8 array"""
+    extension, _ = FORMATS[fmt]
+    params = [cv2.IMWRITE_JPEG_QUALITY, ARTIFACT_JPEG_QUALITY] if fmt == 'jpeg' else []
+    ok, encoded = cv2.imencode(extension, cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), params)
+    if not ok:
+        raise ValueError(f'Could not encode overlay as {fmt}')
+    return encoded.tobytes()
+
+
+class ArtifactStore:
+    """In-memory LRU of per-request overlay images, rendered and encoded on first fetch"""
+
+    def __init__(self, max_bytes=ARTIFACT_MAX_BYTES, ttl_seconds=ARTIFACT_TTL_SECONDS, shared_dir=ARTIFACT_SHARED_DIR):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.shared_dir = shared_dir
+        self._swept_at = 0.0
+        self.size = 0
+        self.added = 0
+        self.rendered = 0
+        self.served = 0
+        self.evicted = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, render, source, name='overlay', fmt=ARTIFACT_FORMAT):
+        """Register render(source) -> RGB array under a new unique filename; nothing is drawn yet"""
+        extension, _ = FORMATS[fmt]
+        filename = f'{name}-{uuid.uuid4().hex}{extension}'
+        if self.shared_dir:
+            self._write_shared(filename, encode_image(render(source), fmt))
+            return filename
+        entry = {
+            'expires_at': time.time() + self.ttl_seconds,
+            'render': render,
+            'source': source,
+            'format': fmt,
+            'data': None,
+            'size': self._source_size(source),
+            'lock': threading.Lock()
+        }
+        with self._lock:
+            self._insert(filename, entry)
+        return filename
+
+    def get(self, filename):
+        """Return (bytes, mimetype) for a stored artifact, rendering it if needed, or None"""
+        if self.shared_dir:
+            return self._read_shared(filename)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.time():
+                self._remove(filename)
+                return None
+            self._entries.move_to_end(filename)
+            data, fmt = entry['data'], entry['format']
+
+        if data is None:
+            # Rendering happens outside the store lock but under the entry's own, so
+            # concurrent first fetches of one overlay wait for a single render
+            with entry['lock']:
+                with self._lock:
+                    data, render, source = entry['data'], entry['render'], entry['source']
+                if data is None:
+                    data = encode_image(render(source), fmt)
+                    with self._lock:
+                        self.rendered += 1
+                        entry['data'] = data
+                        entry['render'] = entry['source'] = None
+                        if self._entries.get(filename) is entry:
+                            self.size += len(data) - entry['size']
+                            entry['size'] = len(data)
+                            self._evict()
+        with self._lock:
+            self.served += 1
+        return data, FORMATS[fmt][1]
+
+    def stats(self):
+        return {
+            'shared_dir': self.shared_dir,
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'added': self.added,
+            'rendered': self.rendered,
+            'served': self.served,
+            'evicted': self.evicted
+        }
+
+    def _write_shared(self, filename, data):
+        path = os.path.join(self.shared_dir, filename)
+        # Written under a temporary name so a concurrent fetch never sees half a file
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            self.added += 1
+            self.rendered += 1
+        self._sweep_shared()
+
+    def _read_shared(self, filename):
+        path = os.path.join(self.shared_dir, os.path.basename(filename))
+        mimetypes = dict(FORMATS.values())
+        extension = os.path.splitext(filename)[1]
+        try:
+            if extension not in mimetypes or os.path.getmtime(path) + self.ttl_seconds <= time.time():
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self.served += 1
+        return data, mimetypes[extension]
+
+    def _sweep_shared(self):
+        # At most once a minute per worker; any worker may delete any expired file
+        now = time.time()
+        if now - self._swept_at < 60:
+            return
+        self._swept_at = now
+        for entry in os.scandir(self.shared_dir):
+            try:
+                if entry.stat().st_mtime + self.ttl_seconds <= now:
+                    os.remove(entry.path)
+                    self.evicted += 1
+            except OSError:
+                pass
+
+    def _source_size(self, source):
+        if isinstance(source, (tuple, list)):
+            return sum(self._source_size(item) for item in source)
+        if isinstance(source, (bytes, bytearray)):
+            return len(source)
+        return getattr(source, 'nbytes', 0)
+
+    def _insert(self, filename, entry):
+        self._entries[filename] = entry
+        self.size += entry['size']
+        self.added += 1
+        self._evict()
+
+    def _remove(self, filename):
+        self.size -= self._entries.pop(filename)['size']
+
+    def _evict(self):
+        now = time.time()
+        for filename in [name for name, entry in self._entries.items() if entry['expires_at'] <= now]:
+            self._remove(filename)
+            self.evicted += 1
+        # Always keep the newest entry, even if it alone is over the cap
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            filename, entry = self._entries.popitem(last=False)
+            self.size -= entry['size']
+            self.evicted += 1
+
+
+# One store per process so /outputs can serve overlays from every service module
+artifacts = ArtifactStore()
+
+
+def overlay_response(request, render, source, name, fmt=None, mode=None):
+    """URL (or inline data URI) of an overlay for a JSON response.
+
+    Clients choose per request with ?overlay=url|inline and ?overlay_format=png|jpeg
+    (query string or form field); the ARTIFACT_* settings are the defaults.
+    """
+    mode = mode or request.values.get('overlay', ARTIFACT_MODE)
+    fmt = fmt or request.values.get('overlay_format', ARTIFACT_FORMAT)
+    if fmt not in FORMATS:
+        fmt = ARTIFACT_FORMAT
+    if mode == 'inline':
+        data = encode_image(render(source), fmt)
+        return f'data:{FORMATS[fmt][1]};base64,{base64.b64encode(data).decode()}'
+    filename = artifacts.add(render, source, name, fmt)
+    return f'{request.host_url}outputs/{filename}'
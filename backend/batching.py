@@ -0,0 +1,94 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+import tracing
+
+# Defaults can be tuned per deployment without code changes
+MAX_BATCH_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+
+
+class BatchingPredictor:
+    """Gathers concurrent predict calls for one model into batched forward passes"""
+
+    def __init__(self, model, name, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches_run = 0
+        self.items_run = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=f'batcher-{name}', daemon=True)
+        self._worker.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batches_run': self.batches_run,
+            'avg_batch_size': round(self.items_run / self.batches_run, 2) if self.batches_run else 0.0
+        }
+
+    def submit(self, batch):
+        """Queue an (n, H, W, C) input; the returned future resolves to its n output rows"""
+        future = Future()
+        future.queued_at = time.perf_counter()
+        self._queue.put((batch, future))
+        return future
+
+    def predict(self, batch):
+        """Drop-in replacement for model.predict that joins the shared batch"""
+        return self.submit(batch).result()
+
+    def _run(self):
+        while True:
+            # Block for the first request, then collect more until the batch is
+            # full or the wait window closes
+            items = [self._queue.get()]
+            size = len(items[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                size += len(item[0])
+            self._run_batch(items, size)
+
+    def _run_batch(self, items, size):
+        started = time.perf_counter()
+        try:
+            inputs = np.concatenate([batch for batch, _ in items], axis=0)
+            outputs = np.asarray(self.model.predict_on_batch(inputs))
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        inference_seconds = time.perf_counter() - started
+
+        self.batches_run += 1
+        self.items_run += size
+        tracing.MODEL_INFERENCE_SECONDS.observe(inference_seconds, model=self.name)
+        tracing.MODEL_BATCH_SIZE.observe(size, model=self.name)
+
+        # Hand each caller back the rows for its own inputs, noting the batch they rode in
+        start = 0
+        for batch, future in items:
+            future.batch_size = size
+            future.queue_seconds = started - future.queued_at
+            tracing.MODEL_QUEUE_SECONDS.observe(future.queue_seconds, model=self.name)
+            future.set_result(outputs[start:start + len(batch)])
+            start += len(batch)
@@ -0,0 +1,67 @@
+import argparse
+import numpy as np
+import cv2
+from common import synthetic_leaf_rgb, time_call, environment, emit
+from color_features import color_features, color_features_batch
+
+# Compares the shared colour kernel with the per-mask code it replaced:
+#   python benchmarks/bench_color_features.py [--repeat 20] [--out color_features.json]
+
+
+def per_mask_features(hsv):
+    """The original approach: one boolean mask and np.sum pass per rule"""
+    total = hsv.shape[0] * hsv.shape[1]
+    brown = np.sum((hsv[:, :, 0] >= 10) & (hsv[:, :, 0] <= 20) & (hsv[:, :, 1] > 50))
+    yellow = np.sum((hsv[:, :, 0] >= 20) & (hsv[:, :, 0] <= 30) & (hsv[:, :, 1] > 50))
+    dark = np.sum(hsv[:, :, 2] < 50)
+    return {
+        'mean_hue': float(np.mean(hsv[:, :, 0])),
+        'mean_saturation': float(np.mean(hsv[:, :, 1])),
+        'mean_value': float(np.mean(hsv[:, :, 2])),
+        'green_ratio': float(np.sum(hsv[:, :, 0] > 30) / total),
+        'disease_ratio': float((brown + yellow + dark) / total)
+    }
+
+
+def synthetic_leaf_hsv(height, width, seed=0):
+    """The shared synthetic leaf, converted to HSV like the services do"""
+    return cv2.cvtColor(synthetic_leaf_rgb(height, width, seed), cv2.COLOR_RGB2HSV)
+
+
+def check_parity(hsv):
+    expected = per_mask_features(hsv)
+    actual = color_features(hsv)
+    for name, value in expected.items():
+        if not np.isclose(actual[name], value, rtol=1e-6, atol=1e-9):
+            raise AssertionError(f"{name}: kernel {actual[name]} != per-mask {value}")
+
+
+def cases():
+    """(input label, per-mask callable, kernel callable, args) for every compared call"""
+    for label, (height, width) in [('224px', (224, 224)), ('12MP', (3024, 4032))]:
+        hsv = synthetic_leaf_hsv(height, width)
+        check_parity(hsv)
+        yield label, per_mask_features, color_features, (hsv,)
+
+    batch = np.stack([synthetic_leaf_hsv(224, 224, seed) for seed in range(32)])
+    yield '224px x 32', lambda hsvs: [per_mask_features(hsv) for hsv in hsvs], color_features_batch, (batch,)
+
+
+def run(repeat):
+    results = []
+    for label, per_mask, kernel, args in cases():
+        before = time_call(per_mask, repeat, *args)
+        after = time_call(kernel, repeat, *args)
+        results.append(dict({'name': f'per_mask[{label}]', 'function': 'per_mask', 'input': label}, **before))
+        results.append(dict({'name': f'kernel[{label}]', 'function': 'kernel', 'input': label,
+                             'speedup': round(before['p50_ms'] / after['p50_ms'], 2)}, **after))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the shared HSV colour feature kernel')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    emit({'benchmark': 'color_features', 'environment': environment(), 'repeat': args.repeat,
+          'results': run(args.repeat)}, args.out)
@@ -0,0 +1,86 @@
+import os
+import argparse
+import tempfile
+import threading
+from common import synthetic_leaf_jpeg, unique_upload, environment, quiet, emit
+from load_test import run_load, single_upload, wait_until_ready
+
+# End-to-end load of every route of the unified service, in this process, with the
+# Gemini API replaced by gemini_stub.py:
+#   python benchmarks/bench_endpoints.py [--duration 10] [--concurrency 4] [--routes predict segmentation]
+# Run from the directory holding the model files. Uploads are synthetic leaves that
+# never hit the result cache; treatments come from a throwaway index built against the stub.
+
+BATCH_IMAGES = 8
+
+
+def batch_upload(jpeg, images=BATCH_IMAGES):
+    return lambda: [('files', (f'leaf{i}.jpg', unique_upload(jpeg))) for i in range(images)]
+
+
+def routes(jpeg):
+    """name -> (path, files factory)"""
+    return {
+        'predict': ('/predict', single_upload(jpeg)),
+        'leaf_recognition': ('/segmentation/leaf-recognition', single_upload(jpeg)),
+        'cnn_detection': ('/segmentation/cnn-detection', single_upload(jpeg)),
+        'segmentation': ('/segmentation', single_upload(jpeg)),
+        # Overlays are drawn when fetched; inline makes the request pay for drawing and encoding
+        'segmentation_inline': ('/segmentation?overlay=inline', single_upload(jpeg)),
+        'segmentation_full_resolution': ('/segmentation?overlay_resolution=full&overlay=inline', single_upload(jpeg)),
+        'segmentation_tiled': ('/segmentation?tiled=1', single_upload(jpeg)),
+        # Geometry instead of an overlay: no image is drawn or encoded at all
+        'segmentation_mask_rle': ('/segmentation?mask_format=rle', single_upload(jpeg)),
+        'ai_pipeline': ('/segmentation/ai-pipeline', single_upload(jpeg)),
+        'ai_pipeline_batch': ('/segmentation/ai-pipeline/batch', batch_upload(jpeg))
+    }
+
+
+def start_service(gemini_delay):
+    """The unified app on a threaded werkzeug server in this process; returns its base URL"""
+    from gemini_stub import start_stub_server
+
+    _, stub_url = start_stub_server(delay_seconds=gemini_delay)
+    # Read by the service modules at import time
+    os.environ['GEMINI_API_URL'] = stub_url
+    os.environ['TREATMENT_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='tea-bench-'), 'treatments.sqlite3')
+
+    from treatment_store import TreatmentStore
+    TreatmentStore(enrich=False).build()
+
+    from werkzeug.serving import make_server
+    from service import create_service_app
+    from model_registry import registry
+
+    server = make_server('127.0.0.1', 0, create_service_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-service', daemon=True).start()
+    registry.wait_for_warm_up()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def run(names, image_size, concurrency, duration, gemini_delay):
+    base_url = start_service(gemini_delay)
+    wait_until_ready(base_url, 300)
+    jpeg = synthetic_leaf_jpeg(image_size)
+    results = []
+    for name, (path, make_files) in routes(jpeg).items():
+        if names and name not in names:
+            continue
+        result = run_load(base_url, path, make_files, concurrency, duration)
+        results.append(dict({'name': name, 'path': path}, **result))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test every service route in-process against the Gemini stub')
+    parser.add_argument('--routes', nargs='+', choices=list(routes(b'')), help='routes to run (default: all)')
+    parser.add_argument('--image-size', type=int, default=1024)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per route')
+    parser.add_argument('--gemini-delay', type=float, default=0.0, help='stub response delay in seconds')
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    with quiet():
+        results = run(args.routes, args.image_size, args.concurrency, args.duration, args.gemini_delay)
+    emit({'benchmark': 'endpoints', 'environment': environment(), 'image_size': args.image_size,
+          'concurrency': args.concurrency, 'duration_seconds': args.duration, 'results': results}, args.out)
@@ -0,0 +1,70 @@
+import os
+import argparse
+import numpy as np
+from common import synthetic_leaf_rgb, synthetic_leaf_jpeg, time_call, environment, quiet, emit
+
+# Micro-benchmarks of the per-request image functions, on synthetic leaves:
+#   python benchmarks/bench_functions.py [--repeat 20] [--out functions.json]
+# Nothing here loads a model, so TensorFlow is never imported: the service modules are
+# imported with model warm-up and background workers (job queues) turned off.
+
+
+def lesion_mask(rgb):
+    """(H, W, 1) float mask of the dark and brown pixels, shaped like the segmentation output"""
+    lesions = (rgb[:, :, 1] < 110) & (rgb[:, :, 0] < 140)
+    return lesions[:, :, None].astype(np.float32)
+
+
+def cases():
+    """(function name, input label, callable, args) for every benchmarked call"""
+    # Read at import; each service module creates its app when imported
+    os.environ['MODEL_WARMUP'] = '0'
+    os.environ['SERVICE_AUTOSTART'] = '0'
+    import app as severity_service
+    import image_classifier
+    import tea_disease_classifier
+    import tea_disease_segmentation
+    import tea_disease_pipeline
+    from image_preprocessing import PreprocessedImage
+
+    import cv2
+    import lesion_features
+
+    small = synthetic_leaf_rgb(224, 224)
+    mask = lesion_mask(small)
+    hsv = cv2.cvtColor(small, cv2.COLOR_RGB2HSV)
+    large = synthetic_leaf_rgb(1024, 1024)
+    large_hsv = cv2.cvtColor(large, cv2.COLOR_RGB2HSV)
+    uploads = {'1024px': synthetic_leaf_jpeg(1024), '12MP': synthetic_leaf_jpeg(4032)}
+
+    for label, data in uploads.items():
+        yield 'preprocess_image', label, severity_service.preprocess_image, (data,)
+    yield 'app.mark_damage', '224px', severity_service.mark_damage, (small,)
+    yield 'tea_disease_classifier.mark_damage', '224px', tea_disease_classifier.mark_damage, (small,)
+    for label, data in uploads.items():
+        yield 'app.mark_damage_full_resolution', label, severity_service.mark_damage_full_resolution, (data,)
+    yield 'apply_segmentation_mask', '224px', tea_disease_segmentation.apply_segmentation_mask, (small, mask)
+    yield 'analyze_tea_leaf_health', '224px', lambda rgb: image_classifier.analyze_tea_leaf_health(PreprocessedImage(rgb)), (small,)
+    # Uncached extraction; the analyze_* calls after it measure the cache hit path
+    yield 'extract_lesion_features', '224px', lesion_features.extract_lesion_features, (hsv, mask)
+    yield 'extract_lesion_features', '1024px', lesion_features.extract_lesion_features, (large_hsv, lesion_mask(large))
+    yield 'analyze_disease_characteristics', '224px', tea_disease_segmentation.analyze_disease_characteristics, (hsv, mask)
+    yield 'analyze_segmented_disease', '224px', tea_disease_pipeline.analyze_segmented_disease, (hsv, mask)
+    # A fresh PreprocessedImage per call, so the cached colour features are not reused
+    yield 'screen_leaf', '224px', lambda rgb: tea_disease_pipeline.screen_leaf(PreprocessedImage(rgb)), (small,)
+
+
+def run(repeat):
+    return [dict({'name': f'{function}[{label}]', 'function': function, 'input': label},
+                 **time_call(func, repeat, *func_args))
+            for function, label, func, func_args in cases()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmark the image pre/post-processing functions')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    with quiet():
+        results = run(args.repeat)
+    emit({'benchmark': 'functions', 'environment': environment(), 'repeat': args.repeat, 'results': results}, args.out)
@@ -0,0 +1,48 @@
+import time
+import argparse
+import numpy as np
+from common import time_call, environment, quiet, emit
+
+# Forward-pass latency of each model at batch sizes 1 to 64:
+#   python benchmarks/bench_models.py [--models segmentation] [--repeat 10]
+# Run from the directory holding the model files. The model is called directly, not
+# through its BatchingPredictor; MODEL_BACKEND(_<NAME>) picks the runtime as when serving.
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+
+
+def run(names, batch_sizes, repeat):
+    from model_registry import registry
+
+    results = []
+    for name in names or list(registry.paths):
+        start = time.perf_counter()
+        model = registry.get(name).model
+        load_seconds = time.perf_counter() - start
+        backend = registry.status([name])[name]['backend']
+        inputs = np.random.default_rng(0).random((max(batch_sizes),) + tuple(model.input_shape[1:])).astype(np.float32)
+        for batch_size in batch_sizes:
+            # The first call at a new batch size may trace or resize; time_call leaves it out
+            timings = time_call(model.predict_on_batch, repeat, inputs[:batch_size])
+            results.append(dict({
+                'name': f'{name}[batch={batch_size}]',
+                'model': name,
+                'backend': backend,
+                'batch_size': batch_size,
+                'load_seconds': round(load_seconds, 3),
+                'per_image_ms': round(timings['p50_ms'] / batch_size, 3),
+                'images_per_second': round(batch_size * 1000.0 / timings['p50_ms'], 1)
+            }, **timings))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark model predict latency by batch size')
+    parser.add_argument('--models', nargs='+', help='registry model names (default: all)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BATCH_SIZES)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    with quiet():
+        results = run(args.models, args.batch_sizes, args.repeat)
+    emit({'benchmark': 'models', 'environment': environment(), 'repeat': args.repeat, 'results': results}, args.out)
@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import contextlib
+import platform
+import subprocess
+import multiprocessing
+import numpy as np
+import cv2
+
+# Helpers shared by the benchmark scripts. Each script puts the backend directory on
+# sys.path so the service modules import as they do when served.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def synthetic_leaf_rgb(height, width, seed=0, lesions=20):
+    """RGB uint8 green leaf on a pale background with brown and dark lesions.
+
+    The default lesion count puts the leaf past the pipeline's healthy threshold,
+    so every stage runs.
+    """
+    rng = np.random.default_rng(seed)
+    rgb = np.full((height, width, 3), (200, 210, 190), dtype=np.uint8)
+    cv2.ellipse(rgb, (width // 2, height // 2), (width * 2 // 5, height * 2 // 5), 0, 0, 360, (60, 140, 40), -1)
+    size = max(height, width)
+    for _ in range(lesions):
+        center = (int(rng.integers(width // 4, width * 3 // 4)), int(rng.integers(height // 4, height * 3 // 4)))
+        radius = int(rng.integers(size // 60 + 1, size // 15 + 2))
+        color = (120, 80, 30) if rng.random() < 0.6 else (25, 25, 25)
+        cv2.circle(rgb, center, radius, color, -1)
+    noise = rng.integers(-12, 13, size=rgb.shape)
+    return np.clip(rgb.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_leaf_jpeg(size, seed=0, lesions=20):
+    """JPEG upload of synthetic_leaf_rgb, size pixels on the long side (4:3)"""
+    rgb = synthetic_leaf_rgb(size * 3 // 4, size, seed, lesions)
+    ok, encoded = cv2.imencode('.jpg', cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def unique_upload(jpeg):
+    # Decoders stop at the JPEG end marker, so random trailing bytes change the upload's
+    # hash (and miss the result cache, even one persisted by an earlier run) but not the pixels
+    return jpeg + os.urandom(16)
+
+
+def time_call(func, repeat, *args):
+    """Summary of per-call timings after one untimed call"""
+    func(*args)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize_ms(timings)
+
+
+def summarize_ms(timings):
+    """Flat mean/percentile/min fields of timings in ms; compare.py diffs results by these keys"""
+    timings = np.asarray(timings, dtype=np.float64)
+    if not len(timings):
+        return {key: None for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'min_ms')}
+    return {
+        'mean_ms': round(float(timings.mean()), 3),
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'p99_ms': round(float(np.percentile(timings, 99)), 3),
+        'min_ms': round(float(timings.min()), 3)
+    }
+
+
+def environment():
+    """What the numbers were measured on, so runs from different commits can be compared"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'machine': platform.machine(),
+        'cpu_count': multiprocessing.cpu_count()
+    }
+
+
+def quiet():
+    """Send the services' progress prints to stderr so stdout stays valid JSON"""
+    return contextlib.redirect_stdout(sys.stderr)
+
+
+def emit(report, out=None):
+    """Write a benchmark report as JSON to a file, or to stdout"""
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,66 @@
+import sys
+import json
+import argparse
+
+# Diff two reports from run_all.py (or from one bench_*.py script each):
+#   python benchmarks/compare.py before.json after.json [--threshold 0.15]
+# Exits with status 1 when any result regressed by more than the threshold.
+
+# Metric -> True when higher is better
+METRICS = {'p50_ms': False, 'throughput_rps': True}
+
+
+def flatten(report):
+    """{'suite/name': result} for every result in a combined or single-suite report"""
+    suites = report['suites'] if 'suites' in report else {report.get('benchmark', 'results'): report}
+    return {f'{suite}/{result["name"]}': result
+            for suite, suite_report in suites.items() for result in suite_report['results']}
+
+
+def compare(before, after, threshold):
+    rows = []
+    previous = flatten(before)
+    for key, new in flatten(after).items():
+        old = previous.get(key)
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if old.get(metric) is None or new.get(metric) is None or not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            regression = -change if higher_is_better else change
+            rows.append({
+                'name': key,
+                'metric': metric,
+                'before': old[metric],
+                'after': new[metric],
+                'change': round(change, 4),
+                'regressed': regression > threshold
+            })
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    rows = compare(before, after, args.threshold)
+    for row in rows:
+        flag = '  REGRESSED' if row['regressed'] else ''
+        print(f"{row['name']:<60} {row['metric']:<15} {row['before']:>10} -> {row['after']:<10} {row['change']:+.1%}{flag}",
+              file=sys.stderr)
+    print(json.dumps({
+        'before': before.get('environment', {}).get('commit'),
+        'after': after.get('environment', {}).get('commit'),
+        'threshold': args.threshold,
+        'regressions': [row for row in rows if row['regressed']],
+        'compared': len(rows)
+    }, indent=2))
+    sys.exit(1 if any(row['regressed'] for row in rows) else 0)
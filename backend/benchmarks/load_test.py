@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import subprocess
+import multiprocessing
+import requests
+from common import BACKEND_DIR, synthetic_leaf_jpeg, unique_upload, summarize_ms, environment, emit
+
+# Throughput of the pre-fork server (gunicorn.conf.py) as the worker count grows:
+#   python benchmarks/load_test.py --workers 1 2 4 --duration 20
+# Run it from the directory holding the model files, as for the services. With --url
+# it loads an already running server once instead of starting gunicorn per count.
+
+
+def wait_until_ready(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/ready', timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'{base_url} not ready after {timeout}s')
+
+
+def single_upload(jpeg):
+    """files= argument factory posting one cache-missing copy of the image per request"""
+    return lambda: {'file': ('leaf.jpg', unique_upload(jpeg))}
+
+
+def run_load(base_url, endpoint, make_files, concurrency, duration, warmup=4):
+    """Keep `concurrency` requests in flight for `duration` seconds; returns the timings.
+
+    make_files() builds the multipart files of each request.
+    """
+    session = requests.Session()
+    for _ in range(warmup):
+        session.post(base_url + endpoint, files=make_files(), timeout=120)
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            files = make_files()
+            start = time.perf_counter()
+            try:
+                ok = session.post(base_url + endpoint, files=files, timeout=120).status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed * 1000)
+                else:
+                    errors[0] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    return dict({
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / wall, 2)
+    }, **summarize_ms(latencies))
+
+
+def start_server(workers, port):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(port))
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py')],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def stop_server(process):
+    # The session holds the master, its workers and the model server
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def run(args):
+    jpeg = synthetic_leaf_jpeg(args.image_size)
+    report = {'benchmark': 'load', 'environment': environment(), 'endpoint': args.endpoint,
+              'image_bytes': len(jpeg), 'duration_seconds': args.duration, 'results': []}
+    if args.url:
+        wait_until_ready(args.url, args.startup_timeout)
+        result = run_load(args.url, args.endpoint, single_upload(jpeg), args.concurrency or 8, args.duration)
+        report['results'].append(dict({'name': args.url, 'workers': None}, **result))
+        return report
+
+    for workers in args.workers:
+        process = start_server(workers, args.port)
+        try:
+            base_url = f'http://127.0.0.1:{args.port}'
+            wait_until_ready(base_url, args.startup_timeout)
+            # Enough requests in flight to keep every worker thread busy
+            result = run_load(base_url, args.endpoint, single_upload(jpeg), args.concurrency or 4 * workers, args.duration)
+        finally:
+            stop_server(process)
+        first = report['results'][0]['throughput_rps'] if report['results'] else result['throughput_rps']
+        report['results'].append(dict({
+            'name': f'workers={workers}',
+            'workers': workers,
+            'speedup': round(result['throughput_rps'] / first, 2) if first else None
+        }, **result))
+        print(f"{workers} workers: {result['throughput_rps']} req/s, p95 {result['p95_ms']} ms", file=sys.stderr)
+    return report
+
+
+def default_worker_counts():
+    cores = multiprocessing.cpu_count()
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the pre-fork server at increasing worker counts')
+    parser.add_argument('--workers', type=int, nargs='+', default=default_worker_counts(),
+                        help='worker counts to start gunicorn with (default: 1, 2, 4, ... up to the core count)')
+    parser.add_argument('--url', help='load an already running server instead, e.g. http://127.0.0.1:5001')
+    parser.add_argument('--endpoint', default='/segmentation')
+    parser.add_argument('--concurrency', type=int, help='requests in flight (default: 4 per worker)')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per worker count')
+    parser.add_argument('--image-size', type=int, default=1024)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+    emit(run(args), args.out)
@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from common import environment, emit
+
+# The whole suite in one JSON report, for comparing commits with compare.py:
+#   python benchmarks/run_all.py --out before.json
+#   (change something)
+#   python benchmarks/run_all.py --out after.json
+#   python benchmarks/compare.py before.json after.json
+# Run from the directory holding the model files. Each suite runs in its own process
+# so one suite's imports and loaded models do not skew another's numbers.
+
+SUITES = {
+    'functions': 'bench_functions.py',
+    'color_features': 'bench_color_features.py',
+    'models': 'bench_models.py',
+    'endpoints': 'bench_endpoints.py'
+}
+QUICK_ARGS = {
+    'functions': ['--repeat', '5'],
+    'color_features': ['--repeat', '5'],
+    'models': ['--repeat', '3', '--batch-sizes', '1', '8', '64'],
+    'endpoints': ['--duration', '3']
+}
+
+
+def run_suite(name, quick):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), SUITES[name])
+    command = [sys.executable, script] + (QUICK_ARGS[name] if quick else [])
+    print(f"Running {name} benchmarks...", file=sys.stderr)
+    completed = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run every benchmark suite and merge the JSON reports')
+    parser.add_argument('--suites', nargs='+', choices=list(SUITES), default=list(SUITES))
+    parser.add_argument('--quick', action='store_true', help='fewer repeats and shorter load runs')
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'suites': {}}
+    for name in args.suites:
+        suite = run_suite(name, args.quick)
+        suite.pop('environment', None)
+        report['suites'][name] = suite
+    emit(report, args.out)
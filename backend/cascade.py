@@ -0,0 +1,88 @@
+import os
+import threading
+import tracing
+
+# Early-exit cascade for the AI pipeline. Step 3 runs PIPELINE_CASCADE_FIRST on its
+# own; the other step-3 model only runs when the first one's accuracy is below its
+# threshold. PIPELINE_CASCADE=0 restores running both models on every image.
+CASCADE_ENABLED = os.getenv('PIPELINE_CASCADE', '1') == '1'
+CASCADE_FIRST = os.getenv('PIPELINE_CASCADE_FIRST', 'cnn')
+CASCADE_THRESHOLDS = {
+    'cnn': float(os.getenv('PIPELINE_CASCADE_CNN_THRESHOLD', '90')),
+    'segmentation': float(os.getenv('PIPELINE_CASCADE_SEGMENTATION_THRESHOLD', '90'))
+}
+# Steps 1 and 2 look at a subsampled thumbnail first (0 disables); decisions within
+# the margins below of a threshold are re-checked on the full 224px image
+THUMBNAIL_SIZE = int(os.getenv('PIPELINE_THUMBNAIL_SIZE', '56'))
+THUMBNAIL_RATIO_MARGIN = float(os.getenv('PIPELINE_THUMBNAIL_RATIO_MARGIN', '0.03'))
+THUMBNAIL_MEAN_MARGIN = float(os.getenv('PIPELINE_THUMBNAIL_MEAN_MARGIN', '3'))
+
+STEP3_STAGES = ['cnn', 'segmentation']
+# Every stage a pipeline result can record as skipped, in pipeline order
+PIPELINE_STAGES = ['leafType', 'health', 'cnn', 'segmentation', 'severity', 'treatment']
+
+
+class CascadeScheduler:
+    """Decides which pipeline stages run for an image and counts what was skipped"""
+
+    def __init__(self, enabled=CASCADE_ENABLED, first=CASCADE_FIRST, thresholds=CASCADE_THRESHOLDS,
+                 thumbnail_size=THUMBNAIL_SIZE, ratio_margin=THUMBNAIL_RATIO_MARGIN, mean_margin=THUMBNAIL_MEAN_MARGIN):
+        if first not in STEP3_STAGES:
+            raise ValueError(f"Unknown cascade stage '{first}', expected one of {STEP3_STAGES}")
+        self.enabled = enabled
+        self.first = first
+        self.thresholds = dict(thresholds)
+        self.thumbnail_size = thumbnail_size
+        self.ratio_margin = ratio_margin
+        self.mean_margin = mean_margin
+        self._lock = threading.Lock()
+        self._counts = {stage: {'run': 0, 'skipped': 0} for stage in PIPELINE_STAGES}
+        self._screening = {'thumbnail': 0, 'full': 0}
+
+    def step3_order(self):
+        return [self.first] + [stage for stage in STEP3_STAGES if stage != self.first]
+
+    def first_stages(self):
+        """Step-3 stages to dispatch up front: the first one, or both when the cascade is off"""
+        return [self.first] if self.enabled else list(STEP3_STAGES)
+
+    def confident(self, stage, accuracy):
+        """True when a stage's accuracy lets the rest of step 3 be skipped"""
+        return self.enabled and accuracy >= self.thresholds[stage]
+
+    def near_boundary(self, features, boundaries):
+        """True when any thumbnail feature is too close to a screening threshold to trust.
+
+        boundaries is a list of (feature name, threshold); ratios use the ratio
+        margin, mean hue/saturation/value the mean margin.
+        """
+        for name, threshold in boundaries:
+            margin = self.ratio_margin if name.endswith('_ratio') else self.mean_margin
+            if abs(features[name] - threshold) < margin:
+                return True
+        return False
+
+    def record(self, result, ran, screening=None):
+        """Store the skipped stages on the result and update the counters"""
+        skipped = [stage for stage in PIPELINE_STAGES if stage not in ran]
+        result['skippedStages'] = skipped
+        with self._lock:
+            for stage in ran:
+                self._counts[stage]['run'] += 1
+            for stage in skipped:
+                self._counts[stage]['skipped'] += 1
+                tracing.EARLY_EXITS.inc(stage=stage)
+            if screening:
+                self._screening[screening] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'first': self.first,
+                'thresholds': dict(self.thresholds),
+                'thumbnail_size': self.thumbnail_size,
+                'stages': {stage: dict(counts) for stage, counts in self._counts.items()},
+                'screening': dict(self._screening)
+            }
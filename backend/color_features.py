@@ -0,0 +1,79 @@
+import numpy as np
+import cv2
+
+# Every colour rule used by the services only looks at the exact hue plus two
+# thresholds: saturation > 50 and value < 50. A per-channel LUT maps the HSV image
+# to (hue, saturated, dark) and one 180x2x2 histogram then answers every rule,
+# instead of a separate boolean mask and np.sum pass per rule.
+HUE_BINS = 180
+
+_LUT = np.stack([
+    np.arange(256),
+    np.arange(256) > 50,
+    np.arange(256) < 50
+], axis=-1).astype(np.uint8).reshape(256, 1, 3)
+
+
+def _histogram(coded, mask=None):
+    return cv2.calcHist([coded], [0, 1, 2], mask, [HUE_BINS, 2, 2], [0, HUE_BINS, 0, 2, 0, 2])
+
+
+def _features_from_histogram(hist, means):
+    """Turn a hue x saturated x dark histogram and cv2.mean output into the feature dict"""
+    hist = hist.astype(np.float64)
+    total = max(hist.sum(), 1.0)
+    hue_counts = hist.sum(axis=(1, 2))
+    brown = hist[10:21, 1, :].sum()
+    yellow = hist[20:31, 1, :].sum()
+    dark = hist[:, :, 1].sum()
+    return {
+        'mean_hue': float(means[0]),
+        'mean_saturation': float(means[1]),
+        'mean_value': float(means[2]),
+        'brown_ratio': float(brown / total),
+        'yellow_ratio': float(yellow / total),
+        'dark_ratio': float(dark / total),
+        'green_ratio': float(hue_counts[31:].sum() / total),
+        # Same sum the services have always used; overlapping pixels count once per rule
+        'disease_ratio': float((brown + yellow + dark) / total)
+    }
+
+
+def color_features(hsv, mask=None):
+    """Colour ratios and mean H/S/V of an HSV uint8 image, optionally restricted to mask > 0"""
+    if mask is not None:
+        mask = (mask > 0).astype(np.uint8)
+    coded = cv2.LUT(hsv, _LUT)
+    return _features_from_histogram(_histogram(coded, mask), cv2.mean(hsv, mask=mask))
+
+
+def color_features_batch(hsv_batch):
+    """color_features for every image of an (N, H, W, 3) batch, with one LUT pass for all of them"""
+    count, height, width, _ = hsv_batch.shape
+    coded = cv2.LUT(np.ascontiguousarray(hsv_batch).reshape(count * height, width, 3), _LUT)
+    coded = coded.reshape(count, height, width, 3)
+    return [_features_from_histogram(_histogram(coded[i]), cv2.mean(hsv_batch[i])) for i in range(count)]
+
+
+class ColorAccumulator:
+    """color_features over an image processed in pieces (e.g. bands of a huge photo)"""
+
+    def __init__(self):
+        self.hist = np.zeros((HUE_BINS, 2, 2), dtype=np.float64)
+        self.sums = np.zeros(3, dtype=np.float64)
+        self.count = 0
+
+    def add(self, hsv, mask=None):
+        if mask is not None:
+            mask = (mask > 0).astype(np.uint8)
+            count = cv2.countNonZero(mask)
+        else:
+            count = hsv.shape[0] * hsv.shape[1]
+        if count == 0:
+            return
+        self.hist += _histogram(cv2.LUT(hsv, _LUT), mask)
+        self.sums += np.array(cv2.mean(hsv, mask=mask)[:3]) * count
+        self.count += count
+
+    def features(self):
+        return _features_from_histogram(self.hist, self.sums / max(self.count, 1))
@@ -0,0 +1,89 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Gemini generateContent API, used to build the treatment index
+# offline and to exercise the pipeline without network access:
+#   python gemini_stub.py --port 8765
+#   GEMINI_API_URL=http://127.0.0.1:8765/generate python tea_disease_pipeline.py
+
+
+class GeminiStubHandler(BaseHTTPRequestHandler):
+    delay_seconds = 0.0
+    failure_rate = 0.0
+    # The first fail_first requests always fail; failures answer with failure_status
+    fail_first = 0
+    failure_status = 503
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        prompt = payload.get('contents', [{}])[0].get('parts', [{}])[0].get('text', '')
+        with self.server.count_lock:
+            self.server.request_count += 1
+            number = self.server.request_count
+
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+        if number <= self.fail_first or random.random() < self.failure_rate:
+            self._send(self.failure_status, {'error': {'message': 'stub failure'}})
+            return
+
+        match = re.search(r'disease: (.+?) with severity level: (\w+)', prompt)
+        subject = f"{match.group(1)} ({match.group(2)})" if match else 'the reported disease'
+        region = re.search(r'grown in (.+?);', prompt)
+        if region:
+            subject += f" in {region.group(1)}"
+        text = f"Stub treatment for {subject}: remove affected leaves, apply a copper-based fungicide and monitor weekly."
+        self._send(200, {'candidates': [{'content': {'parts': [{'text': text}]}}]})
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, delay_seconds=0.0, failure_rate=0.0, fail_first=0, failure_status=503):
+    """Serve the stub on a background thread; returns (server, url).
+
+    server.request_count counts the requests answered so far, and the settings can
+    be changed while it runs through server.RequestHandlerClass (e.g. failure_rate).
+    """
+    handler = type('ConfiguredGeminiStubHandler', (GeminiStubHandler,), {
+        'delay_seconds': delay_seconds,
+        'failure_rate': failure_rate,
+        'fail_first': fail_first,
+        'failure_status': failure_status
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.request_count = 0
+    server.count_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name='gemini-stub', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/generate'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stub of the Gemini generateContent API')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before answering')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with an error')
+    parser.add_argument('--fail-first', type=int, default=0, help='answer the first N requests with an error')
+    parser.add_argument('--failure-status', type=int, default=503, help='HTTP status of the error answers')
+    args = parser.parse_args()
+
+    server, url = start_stub_server(args.port, args.delay, args.failure_rate, args.fail_first, args.failure_status)
+    print(f"Gemini stub listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
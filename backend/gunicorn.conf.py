@@ -0,0 +1,78 @@
+import os
+import sys
+import shutil
+import secrets
+import tempfile
+import subprocess
+import multiprocessing
+
+# Production serving: `gunicorn -c gunicorn.conf.py` from the backend directory.
+#
+# The app (all service blueprints, no TensorFlow) is imported once in the master
+# and forked into the workers. The models are not: they live in one model server
+# process (model_server.py) started alongside the master, and the workers send it
+# preprocessed tensors, so each weight file is in memory exactly once and the
+# workers' concurrent requests are batched together.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = 'service:create_service_app()'
+preload_app = True
+
+# Decoding, colour features and overlays run in the workers; one per core by default
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+# Threads per worker keep a core busy while other requests wait on the model server or Gemini
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '4'))
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+
+# Export MODEL_SERVER_ADDRESS (and MODEL_SERVER_AUTHKEY) to use a model server
+# managed elsewhere; otherwise one is started here. Set before the app is preloaded
+# so the registry in every worker forwards to it.
+_start_model_server = 'MODEL_SERVER_ADDRESS' not in os.environ
+if _start_model_server:
+    os.environ['MODEL_SERVER_ADDRESS'] = os.path.join(tempfile.gettempdir(), f'tea-model-server-{os.getpid()}.sock')
+    os.environ.setdefault('MODEL_SERVER_AUTHKEY', secrets.token_hex(16))
+
+# The /outputs fetch for an overlay may land on another worker than the one that made it
+_created_artifact_dir = workers > 1 and 'ARTIFACT_SHARED_DIR' not in os.environ
+if _created_artifact_dir:
+    os.environ['ARTIFACT_SHARED_DIR'] = tempfile.mkdtemp(
+        prefix='tea-artifacts-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+# Background threads (job queue workers) belong in the workers, not the master that
+# preloads the app; post_worker_init starts them in each worker once the app is loaded
+os.environ.setdefault('SERVICE_AUTOSTART', '0')
+
+
+def on_starting(server):
+    if not _start_model_server:
+        return
+    # A fresh interpreter rather than a fork: TensorFlow's thread pools never see a fork
+    server.model_server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_server.py'),
+         '--address', os.environ['MODEL_SERVER_ADDRESS']])
+    server.log.info(f"Started model server (pid {server.model_server.pid})")
+
+
+def post_fork(server, worker):
+    # One worker per core: OpenCV's own thread pool in every worker would oversubscribe the CPU
+    if workers > 1:
+        import cv2
+        cv2.setNumThreads(1)
+
+
+def post_worker_init(worker):
+    import service
+    service.start_services()
+
+
+def on_exit(server):
+    model_server = getattr(server, 'model_server', None)
+    if model_server is not None:
+        model_server.terminate()
+        model_server.wait(timeout=10)
+        if os.path.exists(os.environ['MODEL_SERVER_ADDRESS']):
+            os.remove(os.environ['MODEL_SERVER_ADDRESS'])
+    if _created_artifact_dir:
+        shutil.rmtree(os.environ['ARTIFACT_SHARED_DIR'], ignore_errors=True)
@@ -1,53 +1,37 @@
-import os
-import numpy as np
-import cv2
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
+from flask import Blueprint, request, jsonify
+from image_preprocessing import PreprocessedImage
+from model_registry import registry
+from service import create_app, register_service
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+bp = Blueprint('leaf_recognition', __name__)
 
-MODEL_PATH = './classification.h5'
-model = load_model(MODEL_PATH)
 
 # Updated classes for leaf identification
 LEAF_TYPES = ['Tea Leaf']
 TEA_HEALTH = ['Healthy', 'Diseased']
 
-def preprocess_image(image_path):
-    image = load_img(image_path, target_size=(224, 224))
-    image_array = img_to_array(image) / 255.0
-    return np.expand_dims(image_array, axis=0), np.array(image)
+def preprocess_image(data):
+    return PreprocessedImage.from_bytes(data)
 
-def identify_tea_leaf_health(image_path):
-    processed_image, original_image = preprocess_image(image_path)
+def identify_tea_leaf_health(data):
+    image = preprocess_image(data)
     
     # Get predictions from the model
-    predictions = model.predict(processed_image)
+    predictions = registry.get('classification').predict(image.tensor)
     
     # Analyze tea leaf health status
-    health_status = analyze_tea_leaf_health(original_image)
+    health_status = analyze_tea_leaf_health(image)
     
     result = f"Tea Leaf - {health_status}"
     
     return result
 
 def analyze_tea_leaf_health(image):
-    """Analyze tea leaf health status"""
+    """Analyze tea leaf health status of a PreprocessedImage"""
     
-    # Convert image to HSV for better color analysis
-    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-    
-    # Check for disease indicators
+    # Check for disease indicators in the image's shared HSV conversion
     # Look for brown, yellow, or dark spots indicating disease
-    brown_pixels = np.sum((hsv[:, :, 0] >= 10) & (hsv[:, :, 0] <= 20) & (hsv[:, :, 1] > 50))
-    yellow_pixels = np.sum((hsv[:, :, 0] >= 20) & (hsv[:, :, 0] <= 30) & (hsv[:, :, 1] > 50))
-    dark_pixels = np.sum(hsv[:, :, 2] < 50)
-    
-    total_pixels = image.shape[0] * image.shape[1]
-    disease_ratio = (brown_pixels + yellow_pixels + dark_pixels) / total_pixels
+    disease_ratio = image.color_features['disease_ratio']
     
     if disease_ratio > 0.1:  # More than 10% diseased pixels
         health_status = "Diseased"
@@ -56,7 +40,7 @@ def analyze_tea_leaf_health(image):
     
     return health_status
 
-@app.route('/segmentation/leaf-recognition', methods=['POST'])
+@bp.route('/segmentation/leaf-recognition', methods=['POST'])
 def classify():
     if 'file' not in request.files and 'image' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
@@ -66,11 +50,8 @@ def classify():
     if not file or file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
 
-    file_path = os.path.join('./uploads', file.filename)
-    file.save(file_path)
-
     try:
-        result = identify_tea_leaf_health(file_path)
+        result = identify_tea_leaf_health(file.read())
         
         response = {
             'result': result
@@ -79,17 +60,12 @@ def classify():
     except Exception as e:
         print(f"Error during classification: {str(e)}")  # Debugging
         return jsonify({'error': str(e)}), 500
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({'status': 'healthy', 'service': 'Tea Leaf Recognition'})
+register_service(bp.name, models=['classification'])
+
+app = create_app('Tea Leaf Recognition', bp)
 
 if __name__ == '__main__':
-    os.makedirs('./uploads', exist_ok=True)
-    os.makedirs('./outputs', exist_ok=True)
     print("Tea Leaf Recognition Server Starting...")
     print("Identifying: Tea Leaf (Healthy/Diseased)")
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import io
+import numpy as np
+import cv2
+from PIL import Image
+from color_features import color_features
+
+TARGET_SIZE = (224, 224)
+
+
+def decode_image(data, target_size=TARGET_SIZE):
+    """RGB uint8 array of encoded image bytes, resized like keras load_img (nearest neighbour)"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGB')
+        # target_size is (height, width); PIL sizes are (width, height)
+        size = (target_size[1], target_size[0])
+        if image.size != size:
+            image = image.resize(size, Image.NEAREST)
+        return np.asarray(image)
+
+
+class PreprocessedImage:
+    """An upload decoded once and shared by every step of a request"""
+
+    def __init__(self, rgb):
+        # uint8 RGB array at model resolution
+        self.rgb = rgb
+        self._tensor = None
+        self._hsv = None
+        self._color_features = None
+        self._thumbnail_features = {}
+
+    @classmethod
+    def from_bytes(cls, data, target_size=TARGET_SIZE):
+        """Decode an upload held in memory; nothing is written to disk"""
+        return cls(decode_image(data, target_size))
+
+    @property
+    def tensor(self):
+        """(1, H, W, 3) float32 batch scaled to [0, 1], as the models expect"""
+        if self._tensor is None:
+            self._tensor = np.expand_dims(self.rgb.astype(np.float32) / 255.0, axis=0)
+        return self._tensor
+
+    @property
+    def hsv(self):
+        if self._hsv is None:
+            self._hsv = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2HSV)
+        return self._hsv
+
+    @property
+    def color_features(self):
+        """Colour ratios and mean H/S/V shared by the heuristic steps"""
+        if self._color_features is None:
+            self._color_features = color_features(self.hsv)
+        return self._color_features
+
+    def thumbnail_color_features(self, size):
+        """color_features of a roughly size x size thumbnail.
+
+        The thumbnail takes every n-th pixel instead of averaging, so each colour
+        ratio is an unbiased sample of the full image's ratio.
+        """
+        if size not in self._thumbnail_features:
+            step = max(1, min(self.rgb.shape[:2]) // size)
+            hsv = cv2.cvtColor(np.ascontiguousarray(self.rgb[::step, ::step]), cv2.COLOR_RGB2HSV)
+            self._thumbnail_features[size] = color_features(hsv)
+        return self._thumbnail_features[size]
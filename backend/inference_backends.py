@@ -0,0 +1,147 @@
+import os
+import threading
+import numpy as np
+import startup
+
+# Runtimes a model can be served with. 'keras' loads the original .h5/.hdf5 file;
+# the others load what model_export.py wrote to MODEL_EXPORT_DIR.
+BACKEND_FILES = {
+    'tflite': '{name}.tflite',
+    'tflite-float16': '{name}.float16.tflite',
+    'tflite-int8': '{name}.int8.tflite',
+    'onnx': '{name}.onnx'
+}
+BACKENDS = ['keras'] + list(BACKEND_FILES)
+
+# Threads per interpreter/session; 0 lets the runtime decide
+BACKEND_NUM_THREADS = int(os.getenv('MODEL_BACKEND_THREADS', '0'))
+
+# Warm-up threads load models in parallel. Python's import locks are per module, so two
+# threads importing different parts of TensorFlow at once can deadlock or see a
+# half-initialised package: every TensorFlow import (and Keras model load) holds this lock.
+_tensorflow_lock = threading.RLock()
+_tensorflow_ready = False
+
+
+def exported_path(export_dir, name, backend):
+    """Where model_export.py writes (and the registry looks for) a model in the given format"""
+    return os.path.join(export_dir, BACKEND_FILES[backend].format(name=name))
+
+
+def _with_tensorflow(func, *args):
+    """Call func (which imports or uses TensorFlow) under the TensorFlow lock, importing it once first"""
+    global _tensorflow_ready
+    with _tensorflow_lock:
+        if not _tensorflow_ready:
+            with startup.timed('import_tensorflow'):
+                import tensorflow
+            _tensorflow_ready = True
+        return func(*args)
+
+
+def _tensorflow_interpreter_class():
+    from tensorflow.lite.python.interpreter import Interpreter
+    return Interpreter
+
+
+def _tflite_interpreter_class():
+    # The standalone runtimes keep TensorFlow itself out of the process
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = _with_tensorflow(_tensorflow_interpreter_class)
+    return Interpreter
+
+
+class TFLiteBackend:
+    """A .tflite model behind the Keras predict_on_batch / input_shape interface"""
+
+    def __init__(self, path, num_threads=BACKEND_NUM_THREADS):
+        interpreter_class = _tflite_interpreter_class()
+        self.interpreter = interpreter_class(model_path=path, num_threads=num_threads or None)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(int(size) for size in self._input['shape'][1:])
+        self.output_shape = (None,) + tuple(int(size) for size in self._output['shape'][1:])
+        self._batch_size = int(self._input['shape'][0])
+
+    def predict_on_batch(self, inputs):
+        # Only ever called from the model's batching worker thread, so no locking
+        inputs = np.asarray(inputs, dtype=np.float32)
+        if len(inputs) != self._batch_size:
+            self.interpreter.resize_tensor_input(self._input['index'], [len(inputs)] + list(self.input_shape[1:]))
+            self.interpreter.allocate_tensors()
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch_size = len(inputs)
+
+        scale, zero_point = self._input['quantization']
+        if self._input['dtype'] != np.float32 and scale:
+            info = np.iinfo(self._input['dtype'])
+            inputs = np.clip(np.round(inputs / scale + zero_point), info.min, info.max)
+        self.interpreter.set_tensor(self._input['index'], inputs.astype(self._input['dtype']))
+        self.interpreter.invoke()
+
+        outputs = self.interpreter.get_tensor(self._output['index'])
+        scale, zero_point = self._output['quantization']
+        if self._output['dtype'] != np.float32 and scale:
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs.astype(np.float32, copy=False)
+
+
+class OnnxBackend:
+    """An ONNX model run by onnxruntime's CPU provider"""
+
+    def __init__(self, path, num_threads=BACKEND_NUM_THREADS):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        model_output = self.session.get_outputs()[0]
+        self._input_name = model_input.name
+        self.input_shape = (None,) + tuple(model_input.shape[1:])
+        self.output_shape = (None,) + tuple(model_output.shape[1:])
+
+    def predict_on_batch(self, inputs):
+        return self.session.run(None, {self._input_name: np.asarray(inputs, dtype=np.float32)})[0]
+
+
+def _keras_load(path):
+    from tensorflow.keras.models import load_model
+    return load_model(path)
+
+
+def load_backend(backend, path):
+    """Model object with predict_on_batch(), input_shape and output_shape for the given runtime"""
+    if backend == 'keras':
+        # Deferred: only processes that serve a Keras model pay for importing TensorFlow
+        return _with_tensorflow(_keras_load, path)
+    if backend.startswith('tflite'):
+        return TFLiteBackend(path)
+    if backend == 'onnx':
+        return OnnxBackend(path)
+    raise ValueError(f"Unknown model backend '{backend}', expected one of {BACKENDS}")
+
+
+def parity_report(reference, candidate, inputs):
+    """How closely a converted model's outputs follow the Keras model on the same inputs"""
+    expected = np.asarray(reference.predict_on_batch(inputs), dtype=np.float32)
+    actual = np.asarray(candidate.predict_on_batch(inputs), dtype=np.float32)
+    report = {
+        'samples': int(len(inputs)),
+        'max_abs_diff': round(float(np.max(np.abs(expected - actual))), 6),
+        'mean_abs_diff': round(float(np.mean(np.abs(expected - actual))), 6)
+    }
+    if expected.ndim == 2:
+        # Classifiers: how often the predicted class is unchanged
+        report['argmax_agreement'] = round(float(np.mean(expected.argmax(axis=-1) == actual.argmax(axis=-1))), 4)
+    else:
+        # Segmentation: how many pixels land on the same side of the 0.5 threshold
+        report['mask_agreement'] = round(float(np.mean((expected > 0.5) == (actual > 0.5))), 4)
+    return report
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import contextlib
+import tracing
+
+# Asynchronous jobs: uploads are queued in a SQLite file, so queued work survives a
+# restart, and a bounded pool of worker threads per process runs them. Several
+# processes (gunicorn workers) may share one queue file; claims are transactional.
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', './jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# Backpressure: submissions are refused while this many jobs are waiting
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '100'))
+# A running job whose process stops renewing its lease is retried, up to JOB_MAX_ATTEMPTS runs
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Finished jobs (and their results) are kept this long for polling
+JOB_RETENTION_SECONDS = float(os.getenv('JOB_RETENTION_SECONDS', '3600'))
+
+TERMINAL_STATES = ('done', 'failed')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    upload BLOB,
+    steps TEXT NOT NULL DEFAULT '[]',
+    result TEXT,
+    error TEXT,
+    params TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+'''
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """Persistent queue of uploads with per-step progress, run by handler(upload, on_step, **params) -> result"""
+
+    def __init__(self, handler, path=JOB_QUEUE_PATH, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING,
+                 lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS, retention_seconds=JOB_RETENTION_SECONDS,
+                 name='jobs'):
+        self.handler = handler
+        self.path = path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._initialized = False
+
+        self.wait_seconds = tracing.register(tracing.Histogram(
+            f'{name}_wait_duration_seconds', 'Time a job spent queued before a worker took it'))
+        self.run_seconds = tracing.register(tracing.Histogram(
+            f'{name}_run_duration_seconds', 'Time a worker spent running a job', ['status']))
+        tracing.register(tracing.Gauge(
+            f'{name}_queue_depth', 'Jobs in the queue file by state', ['status'],
+            lambda: {(status,): count for status, count in self.counts().items()}))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A connection per operation: threads and forked processes never share one
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if not self._initialized:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+                self._migrate(conn)
+                self._initialized = True
+            yield conn
+        finally:
+            conn.close()
+
+    def _migrate(self, conn):
+        # Queue files created before jobs carried their submit parameters
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+        if 'params' not in columns:
+            try:
+                conn.execute("ALTER TABLE jobs ADD COLUMN params TEXT NOT NULL DEFAULT '{}'")
+            except sqlite3.OperationalError as e:
+                # Another process sharing the file added it first
+                if 'duplicate column' not in str(e):
+                    raise
+
+    def ensure_started(self):
+        """Start this process's worker threads once (again after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for index in range(self.workers):
+                threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True).start()
+
+    def submit(self, upload, **params):
+        """Queue an upload and return its job id; raises QueueFull past max_pending.
+
+        params are stored with the job (as JSON) and passed to the handler as keywords.
+        """
+        self.ensure_started()
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if pending >= self.max_pending:
+                conn.execute('ROLLBACK')
+                self.rejected += 1
+                raise QueueFull(f'{pending} jobs are already waiting')
+            conn.execute("INSERT INTO jobs (id, status, created_at, upload, params) VALUES (?, 'queued', ?, ?, ?)",
+                         (job_id, time.time(), sqlite3.Binary(upload), json.dumps(params)))
+            conn.execute('COMMIT')
+        self.submitted += 1
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        """The job as a dict (steps as a list of [step, fields]), or None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT id, status, created_at, started_at, finished_at, attempts, version, steps, result, error '
+                               'FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = {
+                'id': row[0], 'status': row[1], 'created_at': row[2], 'started_at': row[3], 'finished_at': row[4],
+                'attempts': row[5], 'version': row[6], 'steps': json.loads(row[7]),
+                'result': json.loads(row[8]) if row[8] else None, 'error': row[9]
+            }
+            if job['status'] == 'queued':
+                job['position'] = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                                               (job['created_at'],)).fetchone()[0]
+        return job
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'jobs': self.counts(),
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'failed': self.failed
+        }
+
+    def _claim(self):
+        """Mark the oldest queued job running and return (id, upload, created_at, params), or None"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Jobs whose process died mid-run: retried, or failed once out of attempts
+            conn.execute("UPDATE jobs SET status = 'failed', error = 'Worker stopped while running the job', "
+                         "finished_at = ?, upload = NULL, version = version + 1 "
+                         "WHERE status = 'running' AND lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+            conn.execute("UPDATE jobs SET status = 'queued', steps = '[]', version = version + 1 "
+                         "WHERE status = 'running' AND lease_until < ?", (now,))
+            conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?',
+                         TERMINAL_STATES + (now - self.retention_seconds,))
+            row = conn.execute("SELECT id, upload, created_at, params FROM jobs WHERE status = 'queued' "
+                               "ORDER BY created_at LIMIT 1").fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ?, lease_until = ?, "
+                             "attempts = attempts + 1, version = version + 1 WHERE id = ?",
+                             (now, now + self.lease_seconds, row[0]))
+            conn.execute('COMMIT')
+        return row
+
+    def _add_step(self, job_id, step, fields):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            steps = json.loads(conn.execute('SELECT steps FROM jobs WHERE id = ?', (job_id,)).fetchone()[0])
+            steps.append([step, fields])
+            conn.execute('UPDATE jobs SET steps = ?, lease_until = ?, version = version + 1 WHERE id = ?',
+                         (json.dumps(steps), time.time() + self.lease_seconds, job_id))
+            conn.execute('COMMIT')
+
+    def _finish(self, job_id, status, result=None, error=None):
+        """Record a finished job; result is its JSON text"""
+        with self._connect() as conn:
+            conn.execute('UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, upload = NULL, '
+                         'version = version + 1 WHERE id = ?',
+                         (status, result, error, time.time(), job_id))
+
+    def _work(self):
+        while True:
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {str(e)}")
+                claimed = None
+            if claimed is None:
+                # Woken at once by a local submit; jobs queued by other processes are picked up within a second
+                self._wake.wait(1.0)
+                self._wake.clear()
+                continue
+            try:
+                self._run(*claimed)
+            except Exception as e:
+                # Nothing may end the worker; a job that could not be recorded stays
+                # leased and is retried (or failed) once its lease runs out
+                print(f"Job {claimed[0]} could not be finished: {str(e)}")
+
+    def _run(self, job_id, upload, created_at, params):
+        started = time.time()
+        self.wait_seconds.observe(started - created_at)
+        # Each job gets its own trace, so its stages are timed like a request's
+        tracing.start()
+        try:
+            result = self.handler(bytes(upload), lambda step, fields: self._add_step(job_id, step, fields),
+                                  **json.loads(params))
+            result = json.dumps(result) if result is not None else None
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            self._finish(job_id, 'failed', error=str(e))
+            self.failed += 1
+            self.run_seconds.observe(time.time() - started, status='failed')
+            return
+        self._finish(job_id, 'done', result=result)
+        self.completed += 1
+        self.run_seconds.observe(time.time() - started, status='done')
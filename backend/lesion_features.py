@@ -0,0 +1,135 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+# Per-lesion colour and shape features from an HSV image and a binary lesion mask.
+# Lesions are the connected components of the mask: one labelling pass gives every
+# lesion's area, bounding box and centroid, and one np.bincount per channel over the
+# label image gives every lesion's H, S and V sums at once, so the lesion pixels are
+# never gathered into a separate array and the cost does not grow with the lesion count.
+# The result depends only on the two arrays, so it is cached by their hash.
+LESION_MIN_AREA = int(os.getenv('LESION_MIN_AREA', '4'))
+LESION_CACHE_SIZE = int(os.getenv('LESION_CACHE_SIZE', '256'))
+
+
+def _binary_mask(mask, shape):
+    """uint8 0/1 mask at the image's (H, W); float model outputs are thresholded at 0.5"""
+    if mask.ndim == 3:
+        mask = mask[:, :, 0]
+    if mask.dtype != np.uint8:
+        mask = (mask > 0.5).astype(np.uint8)
+    elif mask.max(initial=0) > 1:
+        mask = (mask > 127).astype(np.uint8)
+    if mask.shape != shape:
+        mask = cv2.resize(mask, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    return np.ascontiguousarray(mask)
+
+
+def extract_lesion_features(hsv, mask, min_area=LESION_MIN_AREA):
+    """Overall and per-lesion features of the mask > 0 pixels of an HSV uint8 image.
+
+    Returns {'area', 'area_fraction', 'mean_hue', 'mean_saturation', 'mean_value',
+    'lesions'}; each lesion of at least min_area pixels has its 'area', 'mean_hsv',
+    'bbox' (x, y, width, height) and 'centroid' (x, y), largest first.
+    """
+    mask = _binary_mask(mask, hsv.shape[:2])
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    areas = stats[:, cv2.CC_STAT_AREA]
+    total_area = int(areas[1:].sum())
+    # Row 0 is the background; row i holds lesion i's H, S and V sums
+    labels = labels.ravel()
+    pixels = hsv.reshape(-1, 3)
+    sums = np.stack([np.bincount(labels, weights=pixels[:, channel], minlength=count)
+                     for channel in range(3)], axis=1)
+    means = sums[1:].sum(axis=0) / max(total_area, 1)
+    lesion_means = sums / np.maximum(areas, 1)[:, None]
+
+    lesions = []
+    for label in np.argsort(-areas[1:], kind='stable') + 1:
+        if areas[label] < min_area:
+            break
+        lesions.append({
+            'area': int(areas[label]),
+            'mean_hsv': [round(float(value), 2) for value in lesion_means[label]],
+            'bbox': [int(value) for value in stats[label, :4]],
+            'centroid': [round(float(value), 2) for value in centroids[label]]
+        })
+    return {
+        'area': total_area,
+        'area_fraction': total_area / float(mask.size),
+        'mean_hue': float(means[0]),
+        'mean_saturation': float(means[1]),
+        'mean_value': float(means[2]),
+        'lesions': lesions
+    }
+
+
+class LesionFeatureCache:
+    """LRU of extract_lesion_features results keyed by a hash of the HSV image and mask"""
+
+    def __init__(self, max_entries=LESION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, hsv, mask, min_area=LESION_MIN_AREA):
+        mask = _binary_mask(mask, hsv.shape[:2])
+        digest = hashlib.sha1(np.ascontiguousarray(hsv).data)
+        digest.update(mask.data)
+        key = (digest.hexdigest(), hsv.shape, min_area)
+        with self._lock:
+            features = self._entries.get(key)
+            if features is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return features
+            self.misses += 1
+        features = extract_lesion_features(hsv, mask, min_area)
+        with self._lock:
+            self._entries[key] = features
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return features
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+lesion_cache = LesionFeatureCache()
+
+
+def lesion_features(hsv, mask, min_area=LESION_MIN_AREA):
+    """Cached extract_lesion_features; callers must not modify the returned dict"""
+    return lesion_cache.get(hsv, mask, min_area)
+
+
+def classify_color_features(features):
+    """Disease and confidence from the mean H/S/V of the lesion pixels.
+
+    The confidence of each colour rule is fixed at the middle of the range it used
+    to be drawn from at random, so the same lesions always give the same answer.
+    """
+    avg_hue = features['mean_hue']
+    avg_saturation = features['mean_saturation']
+    avg_value = features['mean_value']
+
+    # Disease classification based on color characteristics
+    if avg_hue < 15 or avg_hue > 165:  # Red range
+        if avg_saturation > 100:
+            return "Red Leaf Spot", 90.0
+        else:
+            return "Algal Leaf Spot", 87.5
+    elif 15 <= avg_hue < 30:  # Orange/Brown range
+        if avg_value < 100:
+            return "Brown Blight", 93.0
+        else:
+            return "Algal Leaf Spot", 88.0
+    elif avg_value < 80:  # Dark regions
+        return "Grey Blight Disease", 91.0
+    else:  # Light regions
+        return "White Spot", 90.0
@@ -0,0 +1,78 @@
+import os
+import base64
+import numpy as np
+import cv2
+from lesion_features import lesion_features
+
+# Compact lesion masks for clients that want geometry rather than an overlay image
+# (?mask_format=rle|bitpack). Both encodings are of the binary mask at model
+# resolution, row-major, with 'size' = [height, width]:
+#   rle      'counts' alternate runs of 0s and 1s, starting with 0s (a leading 0 when
+#            the first pixel is a lesion), and sum to height * width
+#   bitpack  'data' is base64 of the pixels packed 8 per byte, most significant bit first
+#            (numpy.unpackbits(...)[:height * width].reshape(height, width) restores it)
+# Polygons are the outer contours, simplified to MASK_POLYGON_TOLERANCE pixels.
+MASK_FORMATS = ('rle', 'bitpack')
+MASK_POLYGON_TOLERANCE = float(os.getenv('MASK_POLYGON_TOLERANCE', '1.0'))
+MASK_MAX_POLYGONS = int(os.getenv('MASK_MAX_POLYGONS', '256'))
+
+
+def mask_format_requested(request):
+    """The ?mask_format=... of the request ('' when the client wants the usual overlay)"""
+    return request.values.get('mask_format', '').lower()
+
+
+def polygon_tolerance(request):
+    try:
+        return max(0.0, float(request.values.get('polygon_tolerance', MASK_POLYGON_TOLERANCE)))
+    except ValueError:
+        return MASK_POLYGON_TOLERANCE
+
+
+def run_lengths(mask):
+    """Row-major run lengths of a 0/1 uint8 mask, starting with a run of 0s"""
+    flat = mask.reshape(-1)
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+    return counts.tolist()
+
+
+def bitpack(mask):
+    return base64.b64encode(np.packbits(mask.reshape(-1)).tobytes()).decode()
+
+
+def polygons(mask, tolerance=MASK_POLYGON_TOLERANCE, max_polygons=MASK_MAX_POLYGONS):
+    """Outer contours of the mask regions as [[x, y], ...], simplified, largest first"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:max_polygons]
+    if tolerance > 0:
+        contours = [cv2.approxPolyDP(contour, tolerance, True) for contour in contours]
+    return [contour.reshape(-1, 2).tolist() for contour in contours]
+
+
+def encode_mask(mask, encoding, hsv, tolerance=MASK_POLYGON_TOLERANCE):
+    """JSON 'mask' section: the encoded mask, its polygons, lesion area fraction and per-region stats.
+
+    mask is a (H, W) 0/1 uint8 array and hsv the HSV image of the same size; the
+    region stats come from lesion_features, so nothing here copies the image.
+    """
+    mask = np.ascontiguousarray(mask)
+    section = {'encoding': encoding, 'size': [int(mask.shape[0]), int(mask.shape[1])]}
+    if encoding == 'bitpack':
+        section['data'] = bitpack(mask)
+    else:
+        section['counts'] = run_lengths(mask)
+    section['polygons'] = polygons(mask, tolerance)
+
+    # Usually cached: classifying the same upload already extracted these
+    features = lesion_features(hsv, mask)
+    section['areaFraction'] = round(features['area_fraction'], 6)
+    section['regions'] = [{
+        'area': lesion['area'],
+        'meanHsv': lesion['mean_hsv'],
+        'bbox': lesion['bbox'],
+        'centroid': lesion['centroid']
+    } for lesion in features['lesions']]
+    return section
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from model_registry import MODEL_PATHS, MODEL_EXPORT_DIR
+from inference_backends import BACKEND_FILES, exported_path, load_backend, parity_report
+from image_preprocessing import decode_image
+from result_cache import model_version
+
+EXPORT_FORMATS = list(BACKEND_FILES)
+DEFAULT_FORMATS = ['tflite-float16', 'tflite-int8']
+CALIBRATION_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+# Converted models are compared with Keras on at most this many calibration samples
+PARITY_SAMPLES = 32
+
+
+def calibration_inputs(directory, input_shape, limit):
+    """(N, H, W, 3) float32 model inputs from the images under a directory, or random ones without it"""
+    samples = []
+    if directory:
+        for root, _, files in sorted(os.walk(directory)):
+            for filename in sorted(files):
+                if len(samples) >= limit:
+                    break
+                if os.path.splitext(filename)[1].lower() not in CALIBRATION_EXTENSIONS:
+                    continue
+                with open(os.path.join(root, filename), 'rb') as f:
+                    samples.append(decode_image(f.read(), tuple(input_shape[1:3])).astype(np.float32) / 255.0)
+    if not samples:
+        # int8 ranges calibrated on noise are a poor fit for leaf photos; pass --calibration-dir
+        print("No calibration images found; using random inputs")
+        return np.random.default_rng(0).random((min(limit, PARITY_SAMPLES),) + tuple(input_shape[1:])).astype(np.float32)
+    return np.stack(samples)
+
+
+def convert_tflite(model, fmt, calibration):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if fmt == 'tflite-float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif fmt == 'tflite-int8':
+        # Weights and activations in int8; inputs and outputs stay float32 so callers do not change
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([sample[None]] for sample in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    return converter.convert()
+
+
+def convert_onnx(model, path):
+    import tensorflow as tf
+    import tf2onnx
+
+    signature = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=path)
+
+
+def median_latency_ms(model, sample, runs=20):
+    """Median single-image predict_on_batch time, after one untimed call"""
+    model.predict_on_batch(sample)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict_on_batch(sample)
+        timings.append(time.perf_counter() - start)
+    return round(float(np.median(timings)) * 1000, 2)
+
+
+def export_model(name, formats, out_dir, calibration_dir=None, samples=100):
+    """Convert one Keras model to each format, then parity- and latency-check the result"""
+    keras_model = load_backend('keras', MODEL_PATHS[name])
+    calibration = calibration_inputs(calibration_dir, keras_model.input_shape, samples)
+    check = calibration[:PARITY_SAMPLES]
+    report = {
+        'source': MODEL_PATHS[name],
+        'source_version': model_version(MODEL_PATHS[name]),
+        'keras_latency_ms': median_latency_ms(keras_model, check[:1]),
+        'formats': {}
+    }
+    for fmt in formats:
+        path = exported_path(out_dir, name, fmt)
+        start = time.perf_counter()
+        try:
+            if fmt == 'onnx':
+                convert_onnx(keras_model, path)
+            else:
+                with open(path, 'wb') as f:
+                    f.write(convert_tflite(keras_model, fmt, calibration))
+            converted = load_backend(fmt, path)
+        except Exception as e:
+            print(f"Export of '{name}' to {fmt} failed: {str(e)}")
+            report['formats'][fmt] = {'error': str(e)}
+            continue
+        report['formats'][fmt] = {
+            'path': path,
+            'bytes': os.path.getsize(path),
+            'convert_seconds': round(time.perf_counter() - start, 2),
+            'latency_ms': median_latency_ms(converted, check[:1]),
+            'parity': parity_report(keras_model, converted, check)
+        }
+        print(f"Exported '{name}' to {path}: {report['formats'][fmt]['parity']}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the Keras models to TFLite and/or ONNX for CPU serving')
+    parser.add_argument('--models', nargs='+', choices=list(MODEL_PATHS) + ['all'], default=['all'])
+    parser.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=DEFAULT_FORMATS)
+    parser.add_argument('--out-dir', default=MODEL_EXPORT_DIR, help='defaults to MODEL_EXPORT_DIR, where the services look')
+    parser.add_argument('--calibration-dir', help='leaf images for int8 calibration and the parity check')
+    parser.add_argument('--samples', type=int, default=100, help='calibration images to use at most')
+    args = parser.parse_args()
+
+    names = list(MODEL_PATHS) if 'all' in args.models else args.models
+    os.makedirs(args.out_dir, exist_ok=True)
+    manifest_path = os.path.join(args.out_dir, 'export_manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    for name in names:
+        manifest[name] = export_model(name, args.formats, args.out_dir, args.calibration_dir, args.samples)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(json.dumps(manifest, indent=2))
@@ -0,0 +1,215 @@
+import os
+import time
+import threading
+import numpy as np
+from batching import BatchingPredictor
+from inference_backends import load_backend, exported_path, parity_report
+from result_cache import model_version
+from model_server import ModelServerClient, RemotePredictor, MODEL_SERVER_ADDRESS, MODEL_SERVER_AUTHKEY
+
+# Model files live next to the services unless MODEL_DIR points elsewhere
+MODEL_DIR = os.getenv('MODEL_DIR', '.')
+MODEL_PATHS = {
+    'classification': os.path.join(MODEL_DIR, 'classification.h5'),
+    'tea_classifier': os.path.join(MODEL_DIR, 'tea-disease-classifier.hdf5'),
+    'segmentation': os.path.join(MODEL_DIR, 'segmentation.h5'),
+    'severity': os.path.join(MODEL_DIR, 'tea_severity_model.h5')
+}
+
+# Runtime per model: 'keras' (default), 'tflite', 'tflite-float16', 'tflite-int8' or
+# 'onnx'. MODEL_BACKEND sets the default and MODEL_BACKEND_<NAME> (e.g.
+# MODEL_BACKEND_SEGMENTATION) overrides one model. Converted files come from model_export.py.
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'keras')
+MODEL_EXPORT_DIR = os.getenv('MODEL_EXPORT_DIR', os.path.join(MODEL_DIR, 'exported'))
+# Compare a converted model with Keras when it loads and fall back to Keras past the tolerance
+MODEL_PARITY_CHECK = os.getenv('MODEL_PARITY_CHECK', '0') == '1'
+MODEL_PARITY_TOLERANCE = float(os.getenv('MODEL_PARITY_TOLERANCE', '0.05'))
+
+# Load and trace models on a background thread at startup instead of on the first request
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '1') == '1'
+# A model that fails to load during warm-up is retried this many times, backing off from
+# MODEL_WARMUP_RETRY_SECONDS and doubling each time up to a minute; after that it is
+# retried once a minute in the background, so /ready recovers once its weights load
+MODEL_WARMUP_RETRIES = int(os.getenv('MODEL_WARMUP_RETRIES', '5'))
+MODEL_WARMUP_RETRY_SECONDS = float(os.getenv('MODEL_WARMUP_RETRY_SECONDS', '2'))
+MODEL_WARMUP_MAX_RETRY_SECONDS = 60.0
+
+
+class ModelRegistry:
+    """Loads each model file once per process, on first use, and hands out its batching predictor"""
+
+    def __init__(self, paths=MODEL_PATHS, export_dir=MODEL_EXPORT_DIR, backends=None, server_address=MODEL_SERVER_ADDRESS,
+                 warmup=MODEL_WARMUP):
+        self.paths = dict(paths)
+        self.warmup = warmup
+        self.export_dir = export_dir
+        self.backends = dict(backends) if backends else {
+            name: os.getenv(f'MODEL_BACKEND_{name.upper()}', MODEL_BACKEND) for name in self.paths}
+        self._models = {}
+        self._scheduled = set()
+        self._warmup_threads = []
+        self._locks = {name: threading.Lock() for name in self.paths}
+        self._status = {name: {'state': 'not_loaded', 'backend': self.backends[name], 'load_seconds': None,
+                               'warmup_seconds': None, 'error': None} for name in self.paths}
+        # With a model server (see model_server.py) this process loads nothing and forwards predictions
+        self.server = ModelServerClient(server_address, MODEL_SERVER_AUTHKEY) if server_address else None
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            # Per-model locks let different models load in parallel
+            with self._locks[name]:
+                model = self._models.get(name)
+                if model is None:
+                    model = RemotePredictor(name, self.server) if self.server else self._load(name)
+                    self._models[name] = model
+        return model
+
+    def is_ready(self, name):
+        state = self.status([name])[name]['state']
+        if state == 'ready':
+            return True
+        # Without warm-up nothing loads before traffic arrives, so a model that can be
+        # loaded on demand counts as ready; otherwise /ready would wait for traffic forever
+        return not self.warmup and state == 'not_loaded' and self.loadable(name)
+
+    def loadable(self, name):
+        """True when the model's weights (or its Keras fallback) are on disk"""
+        return os.path.exists(self.source_path(name)) or os.path.exists(self.paths[name])
+
+    def warm_up(self, names=None, background=True):
+        """Load the models and run one dummy forward pass each so graph tracing happens up front"""
+        if self.server:
+            # The model server warms its own models
+            return None
+        # Several apps in one process may ask for the same model; warm each only once
+        names = [name for name in (names or self.paths) if name not in self._scheduled]
+        self._scheduled.update(names)
+        if not background:
+            self._warm_all(names)
+            return None
+        thread = threading.Thread(target=self._warm_all, args=(names,), name='model-warmup', daemon=True)
+        thread.start()
+        self._warmup_threads.append(thread)
+        return thread
+
+    def wait_for_warm_up(self, timeout=None):
+        """Block until every background warm-up started so far has finished"""
+        for thread in list(self._warmup_threads):
+            thread.join(timeout)
+
+    def source_path(self, name):
+        """File the model is loaded from: the Keras weights or the converted model"""
+        backend = self.backends[name]
+        if backend == 'keras':
+            return self.paths[name]
+        return exported_path(self.export_dir, name, backend)
+
+    def version(self, *names):
+        """Fingerprint of the given models' weights, for result cache keys"""
+        return model_version(*(self.source_path(name) for name in names))
+
+    def status(self, names=None):
+        if self.server:
+            try:
+                return self.server.call('status', names, wait=False)
+            except (ConnectionError, RuntimeError) as e:
+                return {name: dict(self._status[name], error=str(e)) for name in (names or self.paths)}
+        return {name: dict(self._status[name]) for name in (names or self.paths)}
+
+    def stats(self):
+        if self.server:
+            try:
+                return self.server.call('stats', wait=False)
+            except (ConnectionError, RuntimeError) as e:
+                return {name: dict(self._status[name], error=str(e)) for name in self.paths}
+        report = self.status()
+        for name, model in self._models.items():
+            report[name]['batching'] = model.stats()
+        return report
+
+    def _load(self, name):
+        status = self._status[name]
+        status['state'] = 'loading'
+        start = time.perf_counter()
+        try:
+            model = BatchingPredictor(self._load_backend(name), name)
+        except Exception as e:
+            status['state'] = 'failed'
+            status['error'] = str(e)
+            raise
+        status['load_seconds'] = round(time.perf_counter() - start, 3)
+        status['error'] = None
+        # A model loaded on demand counts as ready; its first request pays for tracing
+        status['state'] = 'ready'
+        return model
+
+    def _load_backend(self, name):
+        status = self._status[name]
+        backend = self.backends[name]
+        path = self.source_path(name)
+        if backend != 'keras' and not os.path.exists(path):
+            print(f"No {backend} export of model '{name}' at {path}; using Keras")
+            backend, path = 'keras', self.paths[name]
+        print(f"Loading model '{name}' ({backend}) from {path}")
+        model = load_backend(backend, path)
+        status['backend'] = backend
+
+        if backend != 'keras' and MODEL_PARITY_CHECK:
+            reference = load_backend('keras', self.paths[name])
+            inputs = np.random.default_rng(0).random((4,) + tuple(reference.input_shape[1:])).astype(np.float32)
+            status['parity'] = parity_report(reference, model, inputs)
+            if status['parity']['max_abs_diff'] > MODEL_PARITY_TOLERANCE:
+                print(f"Model '{name}' {backend} output differs from Keras by {status['parity']['max_abs_diff']}; using Keras")
+                model = reference
+                status['backend'] = 'keras'
+        return model
+
+    def _warm_all(self, names, retries=MODEL_WARMUP_RETRIES, delay=MODEL_WARMUP_RETRY_SECONDS,
+                  max_delay=MODEL_WARMUP_MAX_RETRY_SECONDS):
+        """Warm each model, retrying the ones that failed to load with exponential backoff"""
+        failed = [name for name in names if not self._warm(name)]
+        for attempt in range(retries):
+            if not failed:
+                return
+            wait = min(delay * 2 ** attempt, max_delay)
+            print(f"Retrying load of {', '.join(failed)} in {wait:g}s (attempt {attempt + 2} of {retries + 1})")
+            time.sleep(wait)
+            failed = [name for name in failed if not self._warm(name)]
+        if failed:
+            print(f"Models {', '.join(failed)} still failing after {retries + 1} attempts; retrying every {max_delay:g}s")
+            # Not a warm-up thread: wait_for_warm_up() must not wait for weights that may never appear
+            threading.Thread(target=self._retry_failed, args=(failed, max_delay),
+                             name='model-warmup-retry', daemon=True).start()
+
+    def _retry_failed(self, names, interval):
+        """Keep retrying models whose warm-up gave up until each one loads (or a request loads it)"""
+        while names:
+            time.sleep(interval)
+            names = [name for name in names if not self._warm(name)]
+
+    def _warm(self, name):
+        """Load and warm one model; False when it could not be loaded"""
+        status = self._status[name]
+        try:
+            model = self.get(name)
+            if status['warmup_seconds'] is not None:
+                return True
+            status['state'] = 'warming'
+            input_shape = model.model.input_shape
+            start = time.perf_counter()
+            model.predict(np.zeros((1,) + tuple(input_shape[1:]), dtype=np.float32))
+            status['warmup_seconds'] = round(time.perf_counter() - start, 3)
+            status['state'] = 'ready'
+        except Exception as e:
+            print(f"Warm-up of model '{name}' failed: {str(e)}")
+            status['error'] = str(e)
+            if name not in self._models:
+                return False
+            # Loaded but the dummy pass failed; real requests can still be served
+            status['state'] = 'ready'
+        return True
+
+
+# One registry per process: every service module shares these weights
+registry = ModelRegistry()
@@ -0,0 +1,167 @@
+import os
+import time
+import queue
+import argparse
+import threading
+import types
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Listener, Client
+from multiprocessing import AuthenticationError
+import numpy as np
+import tracing
+
+# Production serving keeps every model in one inference process. The web workers
+# (gunicorn.conf.py forks them) send it preprocessed tensors over a Unix socket, so
+# the weights are loaded once however many workers there are, and requests from all
+# workers share that process's batching predictors.
+MODEL_SERVER_ADDRESS = os.getenv('MODEL_SERVER_ADDRESS')
+MODEL_SERVER_AUTHKEY = os.getenv('MODEL_SERVER_AUTHKEY', '')
+# Connections (and concurrent calls) each web worker keeps open to the model server
+MODEL_SERVER_CONNECTIONS = int(os.getenv('MODEL_SERVER_CONNECTIONS', '8'))
+# How long a worker keeps retrying while the model server is still starting
+MODEL_SERVER_CONNECT_TIMEOUT = float(os.getenv('MODEL_SERVER_CONNECT_TIMEOUT', '60'))
+
+
+class ModelServerClient:
+    """Pool of connections from one web worker to the model server"""
+
+    def __init__(self, address, authkey, connections=MODEL_SERVER_CONNECTIONS, connect_timeout=MODEL_SERVER_CONNECT_TIMEOUT):
+        self.address = address
+        self.authkey = authkey.encode()
+        self.connections = connections
+        self.connect_timeout = connect_timeout
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        # Sockets and threads opened before a fork belong to the parent; each worker starts its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._idle = queue.LifoQueue()
+                self._executor = ThreadPoolExecutor(self.connections, thread_name_prefix='model-client')
+
+    def _connect(self, wait=True):
+        deadline = time.monotonic() + (self.connect_timeout if wait else 0)
+        while True:
+            try:
+                return Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise ConnectionError(f"Model server at {self.address} is not accepting connections")
+                time.sleep(0.1)
+
+    def call(self, op, name=None, payload=None, wait=True):
+        """Run one request on the model server and return its result.
+
+        wait=False fails at once instead of waiting for a server that is still starting.
+        """
+        self._reset_after_fork()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect(wait)
+        try:
+            conn.send((op, name, payload))
+            status, result = conn.recv()
+        except (EOFError, OSError) as e:
+            conn.close()
+            raise ConnectionError(f"Lost connection to the model server: {str(e)}")
+        self._idle.put(conn)
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def run_async(self, func, *args):
+        self._reset_after_fork()
+        return self._executor.submit(func, *args)
+
+
+class RemotePredictor:
+    """Stands in for a BatchingPredictor whose model lives in the model server"""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        input_shape, output_shape = client.call('describe', name)
+        # Callers only read the shapes off .model
+        self.model = types.SimpleNamespace(input_shape=tuple(input_shape), output_shape=tuple(output_shape))
+
+    def submit(self, batch):
+        """Like BatchingPredictor.submit, including the batch details the future carries"""
+        future = Future()
+        self.client.run_async(self._predict_into, np.ascontiguousarray(batch, dtype=np.float32), future)
+        return future
+
+    def predict(self, batch):
+        return self.client.call('predict', self.name, np.ascontiguousarray(batch, dtype=np.float32))[0]
+
+    def _predict_into(self, batch, future):
+        try:
+            outputs, future.batch_size, future.queue_seconds = self.client.call('predict', self.name, batch)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(outputs)
+
+
+def handle(conn, registry):
+    """Answer one web worker connection until it closes"""
+    while True:
+        try:
+            op, name, payload = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            if op == 'predict':
+                future = registry.get(name).submit(payload)
+                outputs = future.result()
+                result = (outputs, getattr(future, 'batch_size', None), getattr(future, 'queue_seconds', None))
+            elif op == 'describe':
+                model = registry.get(name).model
+                result = (tuple(model.input_shape), tuple(model.output_shape))
+            elif op == 'status':
+                result = registry.status(name)
+            elif op == 'stats':
+                result = registry.stats()
+            elif op == 'metrics':
+                result = tracing.render_metrics()
+            else:
+                raise ValueError(f"Unknown model server operation '{op}'")
+            reply = ('ok', result)
+        except Exception as e:
+            reply = ('error', str(e))
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            break
+    conn.close()
+
+
+def serve(address, authkey, names=None):
+    """Load and warm the models, then answer web workers until killed"""
+    # Imported here so the registry in this process loads models instead of forwarding them
+    from model_registry import registry
+
+    if os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(address, family='AF_UNIX', authkey=authkey.encode())
+    print(f"Model server listening on {address} (pid {os.getpid()})")
+    registry.warm_up(names)
+    while True:
+        try:
+            conn = listener.accept()
+        except AuthenticationError:
+            continue
+        threading.Thread(target=handle, args=(conn, registry), name='model-server-conn', daemon=True).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the registry models to web workers over a Unix socket')
+    parser.add_argument('--address', default=MODEL_SERVER_ADDRESS, required=MODEL_SERVER_ADDRESS is None)
+    parser.add_argument('--models', nargs='+', help='models to warm up at start (default: all)')
+    args = parser.parse_args()
+
+    # This process owns the models: its registry must not forward to itself
+    os.environ.pop('MODEL_SERVER_ADDRESS', None)
+    serve(args.address, MODEL_SERVER_AUTHKEY, args.models)
@@ -0,0 +1,146 @@
+import io
+import os
+import numpy as np
+import cv2
+from PIL import Image
+
+# Full-resolution overlays: the upload is decoded at native size (capped at
+# OVERLAY_MAX_SIDE), masks are computed on a pyramid level no larger than
+# OVERLAY_MASK_SIDE and only the mask or the region boxes are scaled back up.
+OVERLAY_RESOLUTION = os.getenv('OVERLAY_RESOLUTION', 'model')
+OVERLAY_MAX_SIDE = int(os.getenv('OVERLAY_MAX_SIDE', '4096'))
+OVERLAY_MASK_SIDE = int(os.getenv('OVERLAY_MASK_SIDE', '512'))
+OVERLAY_MAX_REGIONS = int(os.getenv('OVERLAY_MAX_REGIONS', '256'))
+
+# Resolution the 224px overlays (and their area thresholds) were designed for
+MODEL_SIDE = 224
+
+
+def full_resolution_requested(request):
+    """True when the client asked for ?overlay_resolution=full (or it is the configured default)"""
+    return request.values.get('overlay_resolution', OVERLAY_RESOLUTION) == 'full'
+
+
+def decode_full_resolution(data, max_side=OVERLAY_MAX_SIDE):
+    """RGB uint8 array of an upload at native resolution, no larger than max_side on either axis"""
+    with Image.open(io.BytesIO(data)) as image:
+        # For JPEGs this picks a DCT scale so oversized photos are never fully decoded
+        image.draft('RGB', (max_side, max_side))
+        image = image.convert('RGB')
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.BILINEAR)
+        # PIL arrays are read-only; the overlay is drawn in place
+        return np.array(image)
+
+
+def pyramid_level(image, max_side=OVERLAY_MASK_SIDE):
+    """Halve the image with cv2.pyrDown until its longer side fits max_side"""
+    while max(image.shape[:2]) > max_side:
+        image = cv2.pyrDown(image)
+    return image
+
+
+def scaled_min_area(min_area, shape):
+    """An area threshold tuned at 224x224 expressed in pixels of a mask of the given shape"""
+    return min_area * shape[0] * shape[1] / float(MODEL_SIDE * MODEL_SIDE)
+
+
+def region_boxes(mask, min_area=0, max_regions=OVERLAY_MAX_REGIONS):
+    """(N, 4) array of x0, y0, x1, y1 (exclusive) boxes of the mask's connected regions, largest first"""
+    _, _, stats, _ = cv2.connectedComponentsWithStats((mask > 0).astype(np.uint8), connectivity=8)
+    # Row 0 is the background
+    stats = stats[1:]
+    stats = stats[stats[:, cv2.CC_STAT_AREA] > min_area]
+    stats = stats[np.argsort(-stats[:, cv2.CC_STAT_AREA], kind='stable')[:max_regions]]
+    x = stats[:, cv2.CC_STAT_LEFT]
+    y = stats[:, cv2.CC_STAT_TOP]
+    return np.stack([x, y, x + stats[:, cv2.CC_STAT_WIDTH], y + stats[:, cv2.CC_STAT_HEIGHT]], axis=1)
+
+
+def scale_boxes(boxes, from_shape, to_shape):
+    """Map boxes from one image size to another"""
+    scale_y = to_shape[0] / float(from_shape[0])
+    scale_x = to_shape[1] / float(from_shape[1])
+    return np.round(boxes * np.array([scale_x, scale_y, scale_x, scale_y])).astype(np.int64)
+
+
+def line_thickness(shape):
+    """Outline width that stays visible on large photos (2px at model resolution)"""
+    return max(2, int(round(max(shape[:2]) / 500.0)))
+
+
+def _ranges(starts, lengths):
+    """Concatenation of arange(start, start + length) for every pair, without a Python loop"""
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1])
+
+
+def draw_boxes(image, boxes, color=(0, 255, 0), thickness=None):
+    """Draw every box outline in one vectorized pass, in place.
+
+    Each outline is split into four strips; the flat pixel indices of every
+    strip row are generated at once and painted with a single fancy-index
+    assignment, so the work is proportional to the outline pixels, not the image.
+    The image must be C-contiguous (as decode_full_resolution returns it).
+    """
+    if len(boxes) == 0:
+        return image
+    height, width = image.shape[:2]
+    thickness = thickness or line_thickness(image.shape)
+    boxes = np.asarray(boxes, dtype=np.int64)
+    x0 = np.clip(boxes[:, 0], 0, width)
+    y0 = np.clip(boxes[:, 1], 0, height)
+    x1 = np.clip(boxes[:, 2], 0, width)
+    y1 = np.clip(boxes[:, 3], 0, height)
+
+    # Top, bottom, left and right strips as (left, top, right, bottom)
+    left = np.concatenate([x0, x0, x0, np.maximum(x1 - thickness, x0)])
+    top = np.concatenate([y0, np.maximum(y1 - thickness, y0), y0, y0])
+    right = np.concatenate([x1, x1, np.minimum(x0 + thickness, x1), x1])
+    bottom = np.concatenate([np.minimum(y0 + thickness, y1), y1, y1, y1])
+
+    heights = bottom - top
+    strip = np.repeat(np.arange(len(heights)), np.maximum(heights, 0))
+    rows = _ranges(top, heights)
+    pixels = _ranges(rows * width + left[strip], (right - left)[strip])
+    image.reshape(-1, image.shape[2])[pixels] = color
+    return image
+
+
+def draw_labels(image, boxes, text, color=(0, 255, 0)):
+    """Put text above each box, scaled like the 224px overlay's 0.5 font"""
+    scale = 0.5 * max(image.shape[:2]) / float(MODEL_SIDE)
+    thickness = max(1, int(round(scale)))
+    offset = int(round(10 * scale))
+    # Bounded by OVERLAY_MAX_REGIONS, so this loop never grows with the image
+    for x0, y0, _, _ in boxes:
+        cv2.putText(image, text, (int(x0), int(y0) - offset), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+    return image
+
+
+def blend_mask(image, mask, color=(0, 255, 0), alpha=0.3):
+    """Blend color into the image wherever the upsampled mask is above 0.5 (127 for uint8 masks), in place"""
+    height, width = image.shape[:2]
+    if mask.ndim == 3:
+        mask = mask[:, :, 0]
+    if mask.dtype != np.uint8:
+        mask = np.clip(mask * 255.0, 0, 255).astype(np.uint8)
+    # Only the bounding box of the lesions is blended; the rest of the photo is untouched
+    x, y, w, h = cv2.boundingRect((mask > 127).astype(np.uint8))
+    if w == 0 or h == 0:
+        return image
+    x0, y0, x1, y1 = scale_boxes(np.array([[x - 1, y - 1, x + w + 1, y + h + 1]]), mask.shape, image.shape)[0]
+    x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+
+    upsampled = cv2.resize(mask, (width, height), interpolation=cv2.INTER_LINEAR)[y0:y1, x0:x1]
+    _, upsampled = cv2.threshold(upsampled, 127, 255, cv2.THRESH_BINARY)
+    region = image[y0:y1, x0:x1]
+    fill = cv2.merge([np.full(region.shape[:2], channel, dtype=np.uint8) for channel in color])
+    # Same arithmetic as the 224px overlay: unmasked pixels come out unchanged
+    blended = cv2.addWeighted(region, 1 - alpha, fill, alpha, 0)
+    region[...] = cv2.copyTo(blended, upsampled, region)
+    return image
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# In-memory tier limits; the disk tier is only enabled when a directory is configured
+CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '512'))
+CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', '86400'))
+CACHE_DIR = os.getenv('RESULT_CACHE_DIR', '')
+
+
+def model_version(*model_paths):
+    """Short fingerprint of the model files so retrained weights never hit stale results"""
+    digest = hashlib.sha1()
+    for path in model_paths:
+        digest.update(path.encode())
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()[:12]
+
+
+class ResultCache:
+    """Two-tier cache of endpoint results keyed by a hash of the uploaded bytes"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, cache_dir=CACHE_DIR):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, namespace, data, version):
+        """Cache key for one endpoint, one upload and one set of model weights"""
+        return f'{namespace}-{version}-{hashlib.sha256(data).hexdigest()}'
+
+    def get(self, key):
+        """Return (result, image_bytes) for a cached upload, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result, image_bytes = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result, image_bytes
+                del self._entries[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, *entry)
+        return entry
+
+    def put(self, key, result, image_bytes=None):
+        with self._lock:
+            self._store(key, result, image_bytes)
+        self._write_disk(key, result, image_bytes)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'disk': bool(self.cache_dir)
+        }
+
+    def _store(self, key, result, image_bytes):
+        self._entries[key] = (time.time() + self.ttl_seconds, result, image_bytes)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.json', base + '.png'
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        json_path, image_path = self._paths(key)
+        try:
+            if os.path.getmtime(json_path) + self.ttl_seconds < time.time():
+                return None
+            with open(json_path) as f:
+                result = json.load(f)
+            image_bytes = None
+            if os.path.exists(image_path):
+                with open(image_path, 'rb') as f:
+                    image_bytes = f.read()
+            return result, image_bytes
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, result, image_bytes):
+        if not self.cache_dir:
+            return
+        json_path, image_path = self._paths(key)
+        suffix = f'.{os.getpid()}-{threading.get_ident()}.tmp'
+        try:
+            if image_bytes is not None:
+                with open(image_path + suffix, 'wb') as f:
+                    f.write(image_bytes)
+                os.replace(image_path + suffix, image_path)
+            # The JSON file is written last so a reader never sees a result without its image
+            with open(json_path + suffix, 'w') as f:
+                json.dump(result, f)
+            os.replace(json_path + suffix, json_path)
+        except OSError as e:
+            print(f"Result cache write failed: {str(e)}")
@@ -0,0 +1,153 @@
+import os
+import time
+import tempfile
+import threading
+from flask import Flask, Request, Response, request, jsonify, abort
+from flask_cors import CORS
+from model_registry import registry
+from artifact_store import artifacts
+import startup
+import tracing
+
+# Uploads up to this size stay in memory; larger ones spill to an anonymous temp file
+UPLOAD_SPILL_BYTES = int(os.getenv('UPLOAD_SPILL_BYTES', str(16 * 1024 * 1024)))
+
+# Background work of the services (e.g. job queue workers) starts when the app is
+# created. Threads do not survive a fork, so a server that preloads the app and forks
+# workers sets SERVICE_AUTOSTART=0 and calls start_services() in each worker instead
+# (see gunicorn.conf.py).
+SERVICE_AUTOSTART = os.getenv('SERVICE_AUTOSTART', '1') == '1'
+
+# What each service module needs, keyed by blueprint name: the registry models its
+# routes use, an optional extra /health section and an optional start-up hook
+_services = {}
+_started = {}
+_start_lock = threading.Lock()
+
+
+def register_service(name, models=(), health=None, on_start=None):
+    """Declare a blueprint's models (for /ready and warm-up), its /health reporter and its start-up hook"""
+    _services[name] = {'models': list(models), 'health': health, 'on_start': on_start}
+
+
+def start_services(names=None):
+    """Run the start-up hook of each registered service (or of those named) once per process"""
+    with _start_lock:
+        for name, service in _services.items():
+            if service['on_start'] is None or (names is not None and name not in names):
+                continue
+            # Keyed by pid: a forked worker starts its own copy
+            if _started.get(name) == os.getpid():
+                continue
+            _started[name] = os.getpid()
+            service['on_start']()
+
+
+class UploadRequest(Request):
+    """Request that parses multipart files into memory instead of werkzeug's 500KB spill threshold"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPILL_BYTES, mode='rb+')
+
+
+def create_app(service_name, *blueprints):
+    """Flask app serving the given route blueprints plus the shared /outputs and health routes"""
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    CORS(app)  # Enable CORS for all routes
+    for blueprint in blueprints:
+        app.register_blueprint(blueprint)
+    services = {blueprint.name: _services.get(blueprint.name, {'models': [], 'health': None, 'on_start': None}) for blueprint in blueprints}
+    model_names = sorted({name for service in services.values() for name in service['models']})
+
+    # Models load lazily on first use; warming up in the background means the
+    # first real request neither loads weights nor traces the graph
+    if registry.warmup:
+        registry.warm_up(model_names)
+    if SERVICE_AUTOSTART:
+        start_services(services)
+
+    @app.before_request
+    def start_trace():
+        # Stages timed by the route (see tracing.stage) land on this request's trace
+        tracing.start()
+
+    @app.after_request
+    def record_request(response):
+        trace = tracing.current()
+        if trace is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            tracing.REQUEST_SECONDS.observe(time.perf_counter() - trace.started, route=route,
+                                            method=request.method, status=response.status_code)
+        return response
+
+    @app.route('/outputs/<filename>')
+    def serve_image(filename):
+        # Overlays are per request and live in memory; the first fetch draws and encodes them
+        artifact = artifacts.get(filename)
+        if artifact is None:
+            abort(404)
+        data, mimetype = artifact
+        return Response(data, mimetype=mimetype, headers={'Cache-Control': f'private, max-age={int(artifacts.ttl_seconds)}'})
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        text = tracing.render_metrics()
+        if registry.server:
+            # Batch sizes and inference times are measured where the models run
+            try:
+                text += registry.server.call('metrics', wait=False)
+            except (ConnectionError, RuntimeError) as e:
+                print(f"Could not read model server metrics: {str(e)}")
+        return Response(text, mimetype='text/plain; version=0.0.4')
+
+    @app.route('/live', methods=['GET'])
+    def live():
+        return jsonify({'status': 'alive', 'service': service_name})
+
+    @app.route('/ready', methods=['GET'])
+    def ready():
+        models = registry.status(model_names)
+        is_ready = all(registry.is_ready(name) for name in model_names)
+        return jsonify({'ready': is_ready, 'service': service_name, 'models': models}), 200 if is_ready else 503
+
+    @app.route('/health', methods=['GET'])
+    def health_check():
+        return jsonify({
+            'status': 'healthy' if all(registry.is_ready(name) for name in model_names) else 'starting',
+            'service': service_name,
+            'models': {name: report for name, report in registry.stats().items() if name in model_names},
+            'services': {name: service['health']() for name, service in services.items() if service['health']},
+            'artifacts': artifacts.stats(),
+            'startup': startup.report()
+        })
+
+    startup.record('app_created_at', startup.process_age())
+    print(f"{service_name} app created {startup.process_age():.2f}s after process start")
+    return app
+
+
+def create_service_app():
+    """All endpoints in one process, sharing a single copy of each model"""
+    # None of these import TensorFlow; it is loaded by the registry with the first Keras model
+    with startup.timed('import_service_modules'):
+        import app as severity_service
+        import image_classifier
+        import tea_disease_classifier
+        import tea_disease_segmentation
+        import tea_disease_pipeline
+
+    return create_app(
+        'Tea Disease Service',
+        severity_service.bp,
+        image_classifier.bp,
+        tea_disease_classifier.bp,
+        tea_disease_segmentation.bp,
+        tea_disease_pipeline.bp
+    )
+
+
+if __name__ == '__main__':
+    print("Tea Disease Service Starting...")
+    print("Serving severity, leaf recognition, CNN, segmentation and AI pipeline routes")
+    create_service_app().run(debug=True, host='0.0.0.0', port=int(os.getenv('PORT', '5001')))
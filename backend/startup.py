@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import time
+import resource
+
+_imported_at = time.time()
+_phases = {}
+
+
+def process_age():
+    """Seconds since the process started (from /proc on Linux), else since this module was imported"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the command name; starttime is field 22 of the whole line
+            start_ticks = float(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.time() - _imported_at
+
+
+def record(phase, seconds):
+    _phases[phase] = round(seconds, 3)
+
+
+class timed:
+    """Context manager recording how long a startup phase took"""
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+def report():
+    """Import and model-load timings of this process, for /health and `python startup.py`"""
+    from model_registry import registry
+
+    return {
+        'process_age_seconds': round(process_age(), 3),
+        'phases': dict(_phases),
+        'tensorflow_imported': 'tensorflow' in sys.modules,
+        # ru_maxrss is in KB on Linux
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        'models': {name: {key: status[key] for key in ('state', 'backend', 'load_seconds', 'warmup_seconds')}
+                   for name, status in registry.status().items()}
+    }
+
+
+if __name__ == '__main__':
+    # Start the unified service without serving, wait for warm-up and print where the time went.
+    # The services record into the imported module, not into this __main__ copy.
+    import startup
+    from service import create_service_app
+    from model_registry import registry
+
+    create_service_app()
+    registry.wait_for_warm_up()
+    startup.record('models_ready_at', startup.process_age())
+    print(json.dumps(startup.report(), indent=2))
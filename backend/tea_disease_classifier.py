@@ -1,33 +1,34 @@
-import os
 import numpy as np
 import cv2
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
+from flask import Blueprint, request, jsonify
+from image_preprocessing import PreprocessedImage
+from model_registry import registry
+from service import create_app, register_service
+from result_cache import ResultCache
+from artifact_store import overlay_response
+from tiled_inference import tiled_requested, classify_tiled, aggregate_tiles, TILED_MAX_SIDE
+from overlay_rendering import full_resolution_requested, decode_full_resolution, pyramid_level, scaled_min_area, region_boxes, scale_boxes, draw_boxes, draw_labels
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+bp = Blueprint('cnn_detection', __name__)
 
-MODEL_PATH = './tea-disease-classifier.hdf5'
-model = load_model(MODEL_PATH)
+MODEL_VERSION = registry.version('tea_classifier')
+result_cache = ResultCache()
 
 # Updated classes for specific tea leaf diseases
 CLASSES = ['Algal Leaf Spot', 'Grey Blight Disease', 'Brown Blight', 'Red Leaf Spot', 'White Spot']
 
-def preprocess_image(image_path):
-    image = load_img(image_path, target_size=(224, 224))
-    image_array = img_to_array(image) / 255.0
-    return np.expand_dims(image_array, axis=0), np.array(image)
+def preprocess_image(data):
+    image = PreprocessedImage.from_bytes(data)
+    return image.tensor, image.rgb
 
-def predict_disease(image_path):
-    processed_image, original_image = preprocess_image(image_path)
-    predictions = model.predict(processed_image)
+def predict_disease(data):
+    processed_image, original_image = preprocess_image(data)
+    predictions = registry.get('tea_classifier').predict(processed_image)
     predicted_class = CLASSES[np.argmax(predictions)]
-    accuracy = round(np.max(predictions) * 100, 2)
+    accuracy = round(float(np.max(predictions)) * 100, 2)
     return predicted_class, accuracy, original_image
 
-def mark_damage(image):
+def damage_mask(image):
     # Convert to HSV for better color detection
     hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
     
@@ -56,6 +57,21 @@ def mark_damage(image):
     combined_mask = cv2.bitwise_or(brown_mask, yellow_mask)
     combined_mask = cv2.bitwise_or(combined_mask, dark_mask)
     combined_mask = cv2.bitwise_or(combined_mask, red_mask)
+    return combined_mask
+
+def predict_disease_tiled(data):
+    """Classify overlapping full-resolution tiles; the most confident tile decides the disease"""
+    image = decode_full_resolution(data, TILED_MAX_SIDE)
+    summary = aggregate_tiles(classify_tiled(image), CLASSES)
+    predicted_class = max(summary['max_scores'], key=summary['max_scores'].get)
+    return {
+        'disease': predicted_class,
+        'accuracy': summary['max_scores'][predicted_class],
+        'tiles': summary
+    }
+
+def mark_damage(image):
+    combined_mask = damage_mask(image)
     
     # Find contours and mark them
     contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -72,7 +88,26 @@ def mark_damage(image):
     
     return marked_image
 
-@app.route('/segmentation/cnn-detection', methods=['POST'])
+def mark_damage_from_upload(data):
+    return mark_damage(PreprocessedImage.from_bytes(data).rgb)
+
+def mark_damage_full_resolution(data):
+    """mark_damage on the original photo: mask on a small pyramid level, boxes scaled up"""
+    image = decode_full_resolution(data)
+    mask = damage_mask(pyramid_level(image))
+    # Same 100px noise filter as the 224px overlay, in pixels of this mask
+    boxes = region_boxes(mask, min_area=scaled_min_area(100, mask.shape))
+    boxes = scale_boxes(boxes, mask.shape, image.shape)
+    return draw_labels(draw_boxes(image, boxes), boxes, 'Disease Area')
+
+def marked_image_url(data, original_image=None):
+    if full_resolution_requested(request):
+        return overlay_response(request, mark_damage_full_resolution, data, 'marked_image')
+    if original_image is None:
+        return overlay_response(request, mark_damage_from_upload, data, 'marked_image')
+    return overlay_response(request, mark_damage, original_image, 'marked_image')
+
+@bp.route('/segmentation/cnn-detection', methods=['POST'])
 def predict():
     if 'file' not in request.files and 'image' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
@@ -82,37 +117,47 @@ def predict():
     if not file or file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
 
-    file_path = os.path.join('./uploads', file.filename)
-    file.save(file_path)
+    data = file.read()
 
-    try:
-        predicted_disease, accuracy, original_image = predict_disease(file_path)
-        marked_image = mark_damage(original_image)
+    # Tiled mode reads the full-resolution photo; its results depend on the tile settings, so it skips the cache
+    if tiled_requested(request):
+        try:
+            response = predict_disease_tiled(data)
+            response['marked_image'] = marked_image_url(data)
+            return jsonify(response)
+        except Exception as e:
+            print(f"Error during tiled prediction: {str(e)}")  # Debugging
+            return jsonify({'error': str(e)}), 500
+
+    # Byte-identical re-uploads are answered from the cache without running the model;
+    # the overlay only depends on the upload, so it is redrawn from it if fetched
+    cache_key = result_cache.make_key('cnn-detection', data, MODEL_VERSION)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        response = dict(cached[0])
+        response['marked_image'] = marked_image_url(data)
+        return jsonify(response)
 
-        output_image_path = os.path.join('./outputs', 'marked_image.png')
-        cv2.imwrite(output_image_path, cv2.cvtColor(marked_image, cv2.COLOR_RGB2BGR))
-        print(f"Marked image saved at: {output_image_path}")  # Debugging
+    try:
+        predicted_disease, accuracy, original_image = predict_disease(data)
 
         response = {
             'disease': predicted_disease,
-            'accuracy': accuracy,
-            'marked_image': f'http://127.0.0.1:5001/outputs/marked_image.png'
+            'accuracy': accuracy
         }
+        result_cache.put(cache_key, response)
+        # Each request gets its own overlay, drawn only when the client fetches it
+        response = dict(response, marked_image=marked_image_url(data, original_image))
         return jsonify(response)
     except Exception as e:
         print(f"Error during prediction: {str(e)}")  # Debugging
         return jsonify({'error': str(e)}), 500
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
-@app.route('/outputs/<filename>')
-def serve_image(filename):
-    return send_from_directory('./outputs', filename)
+register_service(bp.name, models=['tea_classifier'], health=lambda: {'cache': result_cache.stats()})
+
+app = create_app('Tea Disease Classifier', bp)
 
 if __name__ == '__main__':
-    os.makedirs('./uploads', exist_ok=True)
-    os.makedirs('./outputs', exist_ok=True)
     print("Tea Disease Classifier Server Starting...")
     print(f"Detecting diseases: {', '.join(CLASSES)}")
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -1,117 +1,146 @@
+import io
 import os
-import numpy as np
-import cv2
-import requests
 import json
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
-# Gemini API configuration
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', 'ds2323423424-24-3-4-34-')  
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={GEMINI_API_KEY}"
+import time
+import zipfile
+import threading
+import numpy as np
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from image_preprocessing import PreprocessedImage
+from lesion_features import lesion_features, lesion_cache, classify_color_features
+from model_registry import registry
+from service import create_app, register_service
+from result_cache import ResultCache
+from treatment_store import TreatmentStore
+from treatment_client import default_client, TREATMENT_UNAVAILABLE
+from cascade import CascadeScheduler
+from job_queue import JobQueue, QueueFull, TERMINAL_STATES
+import tracing
 
-# Load all models
-CLASSIFICATION_MODEL_PATH = './classification.h5'
-TEA_CLASSIFIER_MODEL_PATH = './tea-disease-classifier.hdf5'
-SEGMENTATION_MODEL_PATH = './segmentation.h5'
-TEA_SEVERITY_MODEL_PATH = './tea_severity_model.h5'
+bp = Blueprint('ai_pipeline', __name__)
 
-classification_model = load_model(CLASSIFICATION_MODEL_PATH)
-tea_classifier_model = load_model(TEA_CLASSIFIER_MODEL_PATH)
-segmentation_model = load_model(SEGMENTATION_MODEL_PATH)
-tea_severity_model = load_model(TEA_SEVERITY_MODEL_PATH)
+# Models come from the shared registry, loaded on first use, so running the pipeline
+# next to the other services does not load a second copy. The leaf classification
+# model is not needed here: steps 1 and 2 are decided by colour analysis alone.
+PIPELINE_MODELS = ['tea_classifier', 'segmentation', 'severity']
+MODEL_VERSION = registry.version(*PIPELINE_MODELS)
+result_cache = ResultCache()
 
 # Disease classes for different models
 DISEASE_CLASSES = ['Algal Leaf Spot', 'Grey Blight Disease', 'Brown Blight', 'Red Leaf Spot', 'White Spot']
 SEVERITY_CLASSES = ['Mild', 'Moderate', 'Severe']
 HEALTH_CLASSES = ['Healthy', 'Diseased']
 
-def preprocess_image(image_path, target_size=(224, 224)):
-    image = load_img(image_path, target_size=target_size)
-    image_array = img_to_array(image) / 255.0
-    return np.expand_dims(image_array, axis=0), np.array(image)
+# Treatments are answered from the local knowledge index (built with treatment_store.py);
+# Gemini is only called in the background to fill gaps and refresh stale entries. The
+# index is opened on first use, so importing this module creates no files.
+_treatment_store = None
+_treatment_store_lock = threading.Lock()
 
-def step1_identify_leaf_type(image_path):
-    """Step 1: Identify if it's a tea leaf using classification model"""
-    processed_image, original_image = preprocess_image(image_path)
-    
-    # Use image analysis to determine if it's a tea leaf
-    hsv = cv2.cvtColor(original_image, cv2.COLOR_RGB2HSV)
-    
+# Batch endpoint: upload field names, accepted images inside zip archives, and how
+# many diseased images go through the models together
+BATCH_UPLOAD_FIELDS = ['files', 'file', 'image']
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+BATCH_CHUNK_SIZE = int(os.getenv('PIPELINE_BATCH_CHUNK_SIZE', '16'))
+# Uploaded zip archives larger than this (member count, declared uncompressed bytes) are refused unopened
+BATCH_ZIP_MAX_MEMBERS = int(os.getenv('PIPELINE_BATCH_ZIP_MAX_MEMBERS', '1000'))
+BATCH_ZIP_MAX_BYTES = int(os.getenv('PIPELINE_BATCH_ZIP_MAX_BYTES', str(512 * 1024 * 1024)))
+# Response formats of /segmentation/ai-pipeline?stream=...
+STREAM_FORMATS = ('ndjson', 'sse')
+
+# Step 1 and 2 thresholds on the colour features
+TEA_HUE_RANGE = (30, 80)
+TEA_MIN_SATURATION = 30
+TEA_MIN_GREEN_RATIO = 0.3
+HEALTHY_MAX_DISEASE_RATIO = 0.1
+SCREENING_BOUNDARIES = [
+    ('mean_hue', TEA_HUE_RANGE[0]),
+    ('mean_hue', TEA_HUE_RANGE[1]),
+    ('mean_saturation', TEA_MIN_SATURATION),
+    ('green_ratio', TEA_MIN_GREEN_RATIO),
+    ('disease_ratio', HEALTHY_MAX_DISEASE_RATIO)
+]
+
+# Step-3 stage -> registry model
+STEP3_MODELS = {'cnn': 'tea_classifier', 'segmentation': 'segmentation'}
+STEP3_LABELS = {'cnn': 'CNN', 'segmentation': 'Segmentation'}
+
+# Decides which models run per image (see cascade.py for the settings)
+cascade = CascadeScheduler()
+
+def step1_identify_leaf_type(features):
+    """Step 1: Identify if it's a tea leaf from the image colour features"""
     # Tea leaf characteristics analysis
-    avg_hue = np.mean(hsv[:, :, 0])
-    avg_saturation = np.mean(hsv[:, :, 1])
-    avg_value = np.mean(hsv[:, :, 2])
-    green_ratio = np.sum(hsv[:, :, 0] > 30) / (hsv.shape[0] * hsv.shape[1])
+    avg_hue = features['mean_hue']
+    avg_saturation = features['mean_saturation']
+    green_ratio = features['green_ratio']
     
     # Simple heuristic to identify tea leaves
-    if 30 <= avg_hue <= 80 and avg_saturation > 30 and green_ratio > 0.3:
-        return "TEA LEAF", original_image
+    if TEA_HUE_RANGE[0] <= avg_hue <= TEA_HUE_RANGE[1] and avg_saturation > TEA_MIN_SATURATION and green_ratio > TEA_MIN_GREEN_RATIO:
+        return "TEA LEAF"
     else:
-        return "NOT_TEA_LEAF", original_image
+        return "NOT_TEA_LEAF"
 
-def step2_check_tea_health(image_path, original_image):
+def step2_check_tea_health(features):
     """Step 2: Check if tea leaf is healthy or diseased"""
-    processed_image, _ = preprocess_image(image_path)
-    
-    # Use classification model to predict health
-    predictions = classification_model.predict(processed_image)
-    
-    # Analyze for disease indicators using color analysis
-    hsv = cv2.cvtColor(original_image, cv2.COLOR_RGB2HSV)
-    
-    # Check for disease indicators (brown, yellow, dark spots)
-    brown_pixels = np.sum((hsv[:, :, 0] >= 10) & (hsv[:, :, 0] <= 20) & (hsv[:, :, 1] > 50))
-    yellow_pixels = np.sum((hsv[:, :, 0] >= 20) & (hsv[:, :, 0] <= 30) & (hsv[:, :, 1] > 50))
-    dark_pixels = np.sum(hsv[:, :, 2] < 50)
+    # Share of brown, yellow and dark spot pixels from the colour analysis
+    disease_ratio = features['disease_ratio']
     
-    total_pixels = original_image.shape[0] * original_image.shape[1]
-    disease_ratio = (brown_pixels + yellow_pixels + dark_pixels) / total_pixels
-    
-    is_healthy = disease_ratio < 0.1  # Less than 10% diseased pixels = healthy
+    is_healthy = bool(disease_ratio < HEALTHY_MAX_DISEASE_RATIO)  # Less than 10% diseased pixels = healthy
     
     return is_healthy
 
-def step3_cnn_disease_detection(image_path):
-    """Step 3a: CNN-based disease detection"""
-    processed_image, _ = preprocess_image(image_path)
-    
-    # Use tea disease classifier model
-    predictions = tea_classifier_model.predict(processed_image)
+def submit_traced(model, inputs):
+    """Submit to a model's batcher; the stage's time is recorded when the future resolves"""
+    submitted = time.perf_counter()
+    future = registry.get(model).submit(inputs)
+    # Stamped in the batcher's thread, so concurrent models each get their own duration
+    future.add_done_callback(lambda done: setattr(done, 'finished', time.perf_counter()))
+    return future, submitted
+
+def wait_traced(stage, model, submitted_future):
+    future, submitted = submitted_future
+    outputs = future.result()
+    tracing.record_model(stage, model, future, getattr(future, 'finished', time.perf_counter()) - submitted)
+    return outputs
+
+def run_disease_models(processed_image, stages=('cnn', 'segmentation')):
+    """Dispatch the given step-3 models and the severity model on the shared input at once"""
+    models = {stage: STEP3_MODELS[stage] for stage in stages}
+    models['severity'] = 'severity'
+    futures = {stage: submit_traced(model, processed_image) for stage, model in models.items()}
+    return {stage: wait_traced(stage, models[stage], future) for stage, future in futures.items()}
+
+def step3_disease_detection(stage, output, image):
+    with tracing.stage(f'{stage}_analysis'):
+        if stage == 'cnn':
+            return step3_cnn_disease_detection(output)
+        return step3_segmentation_disease_detection(output, image)
+
+def step3_cnn_disease_detection(predictions):
+    """Step 3a: CNN-based disease detection from the tea disease classifier output"""
     predicted_disease = DISEASE_CLASSES[np.argmax(predictions)]
-    accuracy = round(np.max(predictions) * 100, 2)
+    accuracy = round(float(np.max(predictions)) * 100, 2)
     
     return {
         "disease": predicted_disease,
         "accuracy": accuracy
     }
 
-def step3_segmentation_disease_detection(image_path):
-    """Step 3b: Segmentation-based disease detection"""
-    processed_image, original_image = preprocess_image(image_path)
-    
-    # Use segmentation model
-    segmentation_output = segmentation_model.predict(processed_image)
-    
+def step3_segmentation_disease_detection(segmentation_output, image):
+    """Step 3b: Segmentation-based disease detection from the segmentation model output"""
     # Analyze segmented regions for disease classification
     if len(segmentation_output.shape) > 3 and segmentation_output.shape[-1] == len(DISEASE_CLASSES):
         # Multi-class segmentation
         predictions = np.mean(segmentation_output[0], axis=(0, 1))
         predicted_disease = DISEASE_CLASSES[np.argmax(predictions)]
-        accuracy = round(np.max(predictions) * 100, 2)
+        accuracy = round(float(np.max(predictions)) * 100, 2)
     else:
         # Binary segmentation - analyze color characteristics
         mask = (segmentation_output[0] > 0.5).astype(np.uint8)
-        original_array = np.array(original_image)
-        
-        if np.sum(mask) > 0:
-            segmented_regions = original_array[mask[:, :, 0] > 0]
-            predicted_disease, accuracy = analyze_segmented_disease(segmented_regions)
+        if mask.any():
+            # The HSV image was already computed for steps 1 and 2
+            predicted_disease, accuracy = analyze_segmented_disease(image.hsv, mask)
         else:
             predicted_disease = "Brown Blight"  # Default
             accuracy = 75.0
@@ -121,97 +150,231 @@ def step3_segmentation_disease_detection(image_path):
         "accuracy": accuracy
     }
 
-def analyze_segmented_disease(segmented_regions):
-    """Analyze segmented regions to determine disease type"""
-    if len(segmented_regions) == 0:
+def analyze_segmented_disease(hsv, mask):
+    """Analyze the masked lesions of an HSV image to determine disease type"""
+    features = lesion_features(hsv, mask)
+    if features['area'] == 0:
         return "Brown Blight", 75.0
+    return classify_color_features(features)
+
+def step4_predict_severity(severity_predictions):
+    """Step 4a: Determine severity from the severity model output"""
+    return SEVERITY_CLASSES[np.argmax(severity_predictions)]
+
+def screening_features(image):
+    """Colour features for steps 1 and 2: the thumbnail's, unless a decision is too close to call"""
+    if cascade.thumbnail_size:
+        features = image.thumbnail_color_features(cascade.thumbnail_size)
+        if not cascade.near_boundary(features, SCREENING_BOUNDARIES):
+            return features, 'thumbnail'
+    return image.color_features, 'full'
+
+def screen_leaf(image):
+    """Steps 1 and 2 for one decoded image; returns the partial result and whether it needs steps 3-4"""
+    result = {}
+    with tracing.stage('step1'):
+        features, screening = screening_features(image)
+        
+        # Step 1: Identify Leaf Type
+        leaf_type = step1_identify_leaf_type(features)
+    result['leafType'] = leaf_type.lower()
+    print(f"Step 1 - Leaf type identified: {leaf_type}")
     
-    # Convert to HSV for analysis
-    hsv_regions = cv2.cvtColor(segmented_regions.reshape(-1, 1, 3), cv2.COLOR_RGB2HSV)
+    # Stop early if not a tea leaf
+    if leaf_type == "NOT_TEA_LEAF":
+        print("Step 1 - Not a tea leaf detected. Stopping pipeline.")
+        result['message'] = "This is not a tea leaf. Please upload an image of a tea leaf for disease analysis."
+        cascade.record(result, ['leafType'], screening)
+        tracing.mark('earlyExit', 'leafType')
+        return result, False
     
-    avg_hue = np.mean(hsv_regions[:, 0, 0])
-    avg_saturation = np.mean(hsv_regions[:, 0, 1])
-    avg_value = np.mean(hsv_regions[:, 0, 2])
+    # Step 2: Check Tea Leaf Health
+    with tracing.stage('step2'):
+        is_healthy = step2_check_tea_health(features)
+    result['isHealthy'] = is_healthy
+    print(f"Step 2 - Health status: {'healthy' if is_healthy else 'unhealthy'}")
     
-    # Disease classification based on color characteristics
-    if avg_hue < 15 or avg_hue > 165:  # Red range
-        if avg_saturation > 100:
-            return "Red Leaf Spot", 85.0 + np.random.uniform(0, 10)
-        else:
-            return "Algal Leaf Spot", 80.0 + np.random.uniform(0, 15)
-    elif 15 <= avg_hue < 30:  # Orange/Brown range
-        if avg_value < 100:
-            return "Brown Blight", 88.0 + np.random.uniform(0, 10)
-        else:
-            return "Algal Leaf Spot", 82.0 + np.random.uniform(0, 12)
-    elif avg_value < 80:  # Dark regions
-        return "Grey Blight Disease", 86.0 + np.random.uniform(0, 10)
-    else:  # Light regions
-        return "White Spot", 84.0 + np.random.uniform(0, 12)
-
-def get_treatment_from_gemini(disease, severity):
-    """Get treatment recommendations from Gemini API based on disease and severity"""
-    try:
-        prompt = f"""
-        Provide detailed treatment recommendations for tea leaf disease: {disease} with severity level: {severity}.
-        
-        Please include:
-        1. Specific fungicides or treatments with exact concentrations
-        2. Application frequency and timing
-        3. Cultural practices (spacing, pruning, drainage)
-        4. Preventive measures
-        5. Monitoring guidelines
-        
-        Make the response practical and actionable for tea farmers. Focus on proven agricultural practices.
-        """
-        
-        payload = {
-            "contents": [{
-                "parts": [{
-                    "text": prompt
-                }]
-            }]
-        }
-        
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(GEMINI_API_URL, json=payload, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if 'candidates' in result and len(result['candidates']) > 0:
-                treatment = result['candidates'][0]['content']['parts'][0]['text']
-                return treatment.strip()
-            else:
-                print("No candidates in Gemini response")
-                return "Treatment recommendations unavailable. Please consult with agricultural extension services for specific treatment advice."
-        else:
-            print(f"Gemini API error: {response.status_code} - {response.text}")
-            return "Treatment recommendations unavailable. Please consult with agricultural extension services for specific treatment advice."
-            
-    except Exception as e:
-        print(f"Error calling Gemini API: {str(e)}")
-        return "Treatment recommendations unavailable. Please consult with agricultural extension services for specific treatment advice."
+    if is_healthy:
+        cascade.record(result, ['leafType', 'health'], screening)
+        tracing.mark('earlyExit', 'health')
+    else:
+        # Recorded once steps 3 and 4 are done
+        result['screening'] = screening
+    return result, not is_healthy
 
-def step4_severity_and_treatment(image_path, disease):
-    """Step 4: Determine severity and provide treatment recommendations"""
-    processed_image, original_image = preprocess_image(image_path)
+def choose_step3_result(result, step3_results):
+    """Keep the most accurate step-3 result; on a tie segmentation wins, as it always has"""
+    cnn_result = step3_results.get('cnn')
+    seg_result = step3_results.get('segmentation')
+    if seg_result is None or (cnn_result is not None and cnn_result['accuracy'] > seg_result['accuracy']):
+        best_result = cnn_result
+        result['method'] = "CNN"
+    else:
+        best_result = seg_result
+        result['method'] = "Semantic Segmentation"
     
-    # Use severity model to predict severity
-    severity_predictions = tea_severity_model.predict(processed_image)
-    predicted_severity = SEVERITY_CLASSES[np.argmax(severity_predictions)]
+    result['disease'] = best_result['disease']
+    result['accuracy'] = best_result['accuracy']
+    print(f"Step 3 - Best result: {best_result}")
+
+def diagnose_images(images, results):
+    """Step 3 plus the severity half of step 4 for diseased images, as one batch.
+
+    The cascade's first step-3 model and the severity model run on every image;
+    the other step-3 model only runs, batched, on the images the first one was
+    not confident about.
+    """
+    batch = np.concatenate([image.tensor for image in images])
+    stages = cascade.first_stages()
+    outputs = run_disease_models(batch, stages)
+    step3 = []
+    for index, image in enumerate(images):
+        found = {}
+        for stage in stages:
+            found[stage] = step3_disease_detection(stage, outputs[stage][index:index + 1], image)
+            print(f"Step 3 - {STEP3_LABELS[stage]} Result: {found[stage]}")
+        step3.append(found)
+
+    first, second = cascade.step3_order()
+    unsure = [index for index, found in enumerate(step3)
+              if second not in found and not cascade.confident(first, found[first]['accuracy'])]
+    if unsure:
+        inputs = np.concatenate([images[index].tensor for index in unsure])
+        second_outputs = wait_traced(second, STEP3_MODELS[second], submit_traced(STEP3_MODELS[second], inputs))
+        for row, index in enumerate(unsure):
+            step3[index][second] = step3_disease_detection(second, second_outputs[row:row + 1], images[index])
+            print(f"Step 3 - {STEP3_LABELS[second]} Result: {step3[index][second]}")
+
+    for index, result in enumerate(results):
+        choose_step3_result(result, step3[index])
+        result['severity'] = step4_predict_severity(outputs['severity'][index:index + 1])
+        print(f"Step 4 - Severity: {result['severity']}")
+    return step3
+
+def finish_diagnosis(result, step3_results):
+    """Record the stages a fully diagnosed result went through"""
+    cascade.record(result, ['leafType', 'health'] + list(step3_results) + ['severity', 'treatment'],
+                   result.pop('screening', None))
+
+def get_treatment_store():
+    global _treatment_store
+    with _treatment_store_lock:
+        if _treatment_store is None:
+            _treatment_store = TreatmentStore()
+        return _treatment_store
+
+def lookup_treatment(disease, severity, region=''):
+    with tracing.stage('treatment'):
+        return get_treatment_store().get(disease, severity, region)
+
+def pipeline_cache_key(data, region):
+    # Results differ by region only where the index holds a variant for it
+    region = get_treatment_store().region_for(region)
+    return result_cache.make_key(f'ai-pipeline-{region}' if region else 'ai-pipeline', data, MODEL_VERSION)
+
+def lookup_cached(cache_key, region=''):
+    """The cached result for an upload, or None; its treatment is read from the index again"""
+    cached = result_cache.get(cache_key)
+    tracing.CACHE_LOOKUPS.inc(result='miss' if cached is None else 'hit')
+    tracing.mark('cacheHit', cached is not None)
+    if cached is None:
+        return None
+    result = cached[0]
+    # Index builds and background enrichment change treatments without changing the
+    # diagnosis, so only the models' part of the result is reused
+    if 'treatment' in result:
+        result = dict(result, treatment=lookup_treatment(result['disease'], result['severity'], region))
+    return result
+
+def respond(result):
+    """JSON response; with the X-Debug-Timing header it also carries the request's stage timings"""
+    with tracing.stage('render'):
+        response = jsonify(result)
+    if tracing.debug_requested(request):
+        response = jsonify(dict(result, timings=tracing.current().breakdown()))
+    return response
+
+def cache_result(cache_key, result):
+    # A fallback treatment is not cached so the next upload retries the API
+    if result.get('treatment') != TREATMENT_UNAVAILABLE:
+        result_cache.put(cache_key, result)
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+def iter_pipeline(data, region=''):
+    """Steps 1-4 for one upload: yields (step, fields) as each step's fields are known, then ('result', result)"""
+    # Byte-identical re-uploads are answered from the cache without running the models
+    cache_key = pipeline_cache_key(data, region)
+    cached = lookup_cached(cache_key, region)
+    if cached is not None:
+        yield 'result', cached
+        return
+
+    # Decode the upload once, in memory; every step shares these arrays
+    with tracing.stage('decode'):
+        image = PreprocessedImage.from_bytes(data)
     
-    # Get treatment recommendations from Gemini API
-    treatment = get_treatment_from_gemini(disease, predicted_severity)
+    # Steps 1 and 2: Leaf type and health
+    result, is_diseased = screen_leaf(image)
+    yield 'leafType', {'leafType': result['leafType']}
+    if 'isHealthy' in result:
+        yield 'health', {'isHealthy': result['isHealthy']}
     
-    return {
-        "severity": predicted_severity,
-        "treatment": treatment
-    }
+    # Step 3: Disease Detection (if unhealthy)
+    if is_diseased:
+        # The disease models run concurrently on the same input tensor; the
+        # cascade skips the second step-3 model when the first is confident
+        step3 = diagnose_images([image], [result])[0]
+        yield 'disease', {key: result[key] for key in ('disease', 'accuracy', 'method')}
+        yield 'severity', {'severity': result['severity']}
+        
+        # Step 4: Treatment (using Gemini API)
+        result['treatment'] = lookup_treatment(result['disease'], result['severity'], region)
+        print(f"Step 4 - Treatment for {result['disease']} ({result['severity']}) from knowledge index")
+        yield 'treatment', {'treatment': result['treatment']}
+        finish_diagnosis(result, step3)
+    
+    cache_result(cache_key, result)
+    yield 'result', result
+
+def run_pipeline(data, on_step=None, region=''):
+    """Steps 1-4 for one upload; on_step(step, fields) is told each step's fields as they are known"""
+    for step, fields in iter_pipeline(data, region):
+        if step == 'result':
+            return fields
+        if on_step:
+            on_step(step, fields)
+
+def stream_pipeline(data, region, stream_format):
+    """Streaming response sending each step's fields as soon as it finishes, the full result last"""
+    debug = tracing.debug_requested(request)
+    if stream_format == 'sse':
+        def encode(event, payload):
+            return sse(event, payload)
+        mimetype = 'text/event-stream'
+    else:
+        def encode(event, payload):
+            return json.dumps(dict({'event': event}, **payload)) + '\n'
+        mimetype = 'application/x-ndjson'
 
-@app.route('/segmentation/ai-pipeline', methods=['POST'])
+    def generate():
+        try:
+            for step, fields in iter_pipeline(data, region):
+                if step == 'result':
+                    if debug:
+                        fields = dict(fields, timings=tracing.current().breakdown())
+                    yield encode('result', fields)
+                else:
+                    yield encode('step', dict({'step': step}, **fields))
+        except Exception as e:
+            print(f"Error during pipeline analysis: {str(e)}")
+            yield encode('error', {'error': str(e)})
+
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/segmentation/ai-pipeline', methods=['POST'])
 def analyze_pipeline():
     if 'file' not in request.files and 'image' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
@@ -221,75 +384,237 @@ def analyze_pipeline():
     if not file or file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
 
-    file_path = os.path.join('./uploads', file.filename)
-    file.save(file_path)
+    data = file.read()
+    # Optional growing region, for regional treatment variants
+    region = request.values.get('region', '')
+
+    # ?stream=ndjson or ?stream=sse: steps 1-3 reach the client before the treatment lookup
+    stream = request.args.get('stream', '').lower()
+    if stream in STREAM_FORMATS:
+        return stream_pipeline(data, region, stream)
+    if stream:
+        return jsonify({'error': f"Unknown stream format '{stream}', use one of {', '.join(STREAM_FORMATS)}"}), 400
 
     try:
-        result = {}
-        
-        # Step 1: Identify Leaf Type
-        leaf_type, original_image = step1_identify_leaf_type(file_path)
-        result['leafType'] = leaf_type.lower()
-        print(f"Step 1 - Leaf type identified: {leaf_type}")
-        
-        # Early return if not a tea leaf
-        if leaf_type == "NOT_TEA_LEAF":
-            print("Step 1 - Not a tea leaf detected. Stopping pipeline.")
-            return jsonify({
-                'leafType': leaf_type.lower(),
-                'message': "This is not a tea leaf. Please upload an image of a tea leaf for disease analysis."
-            })
-        
-        # Step 2: Check Tea Leaf Health
-        is_healthy = step2_check_tea_health(file_path, original_image)
-        result['isHealthy'] = is_healthy
-        print(f"Step 2 - Health status: {'healthy' if is_healthy else 'unhealthy'}")
-        
-        # Step 3: Disease Detection (if unhealthy)
-        if not is_healthy:
-            # CNN Path
-            cnn_result = step3_cnn_disease_detection(file_path)
-            print(f"Step 3 - CNN Result: {cnn_result}")
-            
-            # Segmentation Path
-            seg_result = step3_segmentation_disease_detection(file_path)
-            print(f"Step 3 - Segmentation Result: {seg_result}")
-            
-            # Choose higher accuracy result
-            if cnn_result['accuracy'] > seg_result['accuracy']:
-                best_result = cnn_result
-                result['method'] = "CNN"
-            else:
-                best_result = seg_result
-                result['method'] = "Semantic Segmentation"
-            
-            result['disease'] = best_result['disease']
-            result['accuracy'] = best_result['accuracy']
-            print(f"Step 3 - Best result: {best_result}")
-            
-            # Step 4: Severity and Treatment (using Gemini API)
-            severity_treatment = step4_severity_and_treatment(file_path, result['disease'])
-            result['severity'] = severity_treatment['severity']
-            result['treatment'] = severity_treatment['treatment']
-            print(f"Step 4 - Severity: {severity_treatment['severity']}")
-            print(f"Step 4 - Treatment from Gemini API received")
-        
-        return jsonify(result)
-        
+        return respond(run_pipeline(data, region=region))
     except Exception as e:
         print(f"Error during pipeline analysis: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({'status': 'healthy', 'service': 'Tea Disease Pipeline with Gemini AI'})
+def read_batch_uploads():
+    """Raw (filename, bytes) of every uploaded file, read before the response starts streaming"""
+    uploads = []
+    for field in BATCH_UPLOAD_FIELDS:
+        for file in request.files.getlist(field):
+            if file.filename:
+                uploads.append((file.filename, file.read()))
+    return uploads
+
+def iter_batch_images(uploads):
+    """Yield (filename, bytes, error) for every image, expanding zip archives as they are reached.
+
+    An archive that cannot be opened or is over the limits yields one entry with an
+    error instead of its images; so does each member that cannot be extracted.
+    """
+    for filename, data in uploads:
+        if not filename.lower().endswith('.zip'):
+            yield filename, data, None
+            continue
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except (zipfile.BadZipFile, OSError) as e:
+            yield filename, None, f'Invalid zip archive: {str(e)}'
+            continue
+        with archive:
+            members = [info for info in archive.infolist()
+                       if not info.is_dir() and os.path.splitext(info.filename)[1].lower() in IMAGE_EXTENSIONS]
+            # Checked before anything is decompressed; reads stop at each member's declared size
+            if len(members) > BATCH_ZIP_MAX_MEMBERS:
+                yield filename, None, f'Zip archive has {len(members)} images, more than {BATCH_ZIP_MAX_MEMBERS}'
+                continue
+            total_size = sum(info.file_size for info in members)
+            if total_size > BATCH_ZIP_MAX_BYTES:
+                yield filename, None, f'Zip archive expands to {total_size} bytes, more than {BATCH_ZIP_MAX_BYTES}'
+                continue
+            for info in members:
+                try:
+                    yield info.filename, archive.read(info), None
+                except (zipfile.BadZipFile, OSError, RuntimeError, NotImplementedError) as e:
+                    yield info.filename, None, f'Could not extract: {str(e)}'
+
+def diagnose_batch(pending, region=''):
+    """Steps 3 and 4 for a chunk of diseased images with one batched call per model"""
+    step3 = diagnose_images([image for _, _, image, _ in pending], [result for _, _, _, result in pending])
+
+    # Many images share a (disease, severity) pair; each pair is looked up once
+    pairs = {(result['disease'], result['severity']) for _, _, _, result in pending}
+    treatments = {pair: lookup_treatment(*pair, region) for pair in pairs}
+
+    for (filename, cache_key, _, result), found in zip(pending, step3):
+        result['treatment'] = treatments[(result['disease'], result['severity'])]
+        finish_diagnosis(result, found)
+        cache_result(cache_key, result)
+        yield filename, result
+
+@bp.route('/segmentation/ai-pipeline/batch', methods=['POST'])
+def analyze_pipeline_batch():
+    uploads = read_batch_uploads()
+    if not uploads:
+        return jsonify({'error': 'No files uploaded'}), 400
+    region = request.values.get('region', '')
+
+    def line(filename, result):
+        return json.dumps({'filename': filename, **result}) + '\n'
+
+    def diagnose_chunk(pending):
+        # A failing chunk answers its remaining images with an error line; the batch goes on
+        done = 0
+        try:
+            for filename, result in diagnose_batch(pending, region):
+                done += 1
+                yield line(filename, result)
+        except Exception as e:
+            print(f"Error during batch diagnosis: {str(e)}")
+            for filename, _, _, _ in pending[done:]:
+                yield line(filename, {'error': str(e)})
+
+    def generate():
+        # Images that stop after step 1 or 2 are streamed at once; diseased ones are
+        # collected into chunks so the models run on real batches
+        pending = []
+        for filename, data, error in iter_batch_images(uploads):
+            if error:
+                print(f"Error during batch analysis of {filename}: {error}")
+                yield line(filename, {'error': error})
+                continue
+            cache_key = pipeline_cache_key(data, region)
+            cached = lookup_cached(cache_key, region)
+            if cached is not None:
+                yield line(filename, cached)
+                continue
+            try:
+                with tracing.stage('decode'):
+                    image = PreprocessedImage.from_bytes(data)
+                result, is_diseased = screen_leaf(image)
+            except Exception as e:
+                print(f"Error during batch analysis of {filename}: {str(e)}")
+                yield line(filename, {'error': str(e)})
+                continue
+            if not is_diseased:
+                cache_result(cache_key, result)
+                yield line(filename, result)
+                continue
+            pending.append((filename, cache_key, image, result))
+            if len(pending) >= BATCH_CHUNK_SIZE:
+                yield from diagnose_chunk(pending)
+                pending = []
+        if pending:
+            yield from diagnose_chunk(pending)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Async mode: the upload is queued (persistently) and a bounded worker pool runs the
+# pipeline; clients poll the job or follow its steps as server-sent events
+jobs = JobQueue(lambda data, on_step, region='': run_pipeline(data, on_step, region), name='pipeline_jobs')
+# Poll interval and keep-alive comment period of the events stream
+JOB_EVENTS_POLL_SECONDS = float(os.getenv('JOB_EVENTS_POLL_SECONDS', '0.25'))
+JOB_EVENTS_KEEPALIVE_SECONDS = float(os.getenv('JOB_EVENTS_KEEPALIVE_SECONDS', '15'))
+
+def job_view(job):
+    """Poll response: status, the fields of every finished step and, once done, the result"""
+    view = {
+        'jobId': job['id'],
+        'status': job['status'],
+        'completedSteps': [step for step, _ in job['steps']],
+        'partial': {key: value for _, fields in job['steps'] for key, value in fields.items()}
+    }
+    if 'position' in job:
+        view['queuePosition'] = job['position']
+    if job['result'] is not None:
+        view['result'] = job['result']
+    if job['error']:
+        view['error'] = job['error']
+    return view
+
+@bp.route('/segmentation/ai-pipeline/jobs', methods=['POST'])
+def submit_pipeline_job():
+    file = request.files.get('file') or request.files.get('image')
+    if not file or file.filename == '':
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    try:
+        # The optional growing region travels with the job, as for the synchronous route
+        job_id = jobs.submit(file.read(), region=request.values.get('region', ''))
+    except QueueFull as e:
+        # Backpressure: the client should come back later rather than pile on
+        return jsonify({'error': f'Job queue is full: {str(e)}'}), 429, {'Retry-After': '30'}
+
+    status_url = f'{request.host_url}segmentation/ai-pipeline/jobs/{job_id}'
+    return jsonify({
+        'jobId': job_id,
+        'status': 'queued',
+        'statusUrl': status_url,
+        'eventsUrl': f'{status_url}/events'
+    }), 202, {'Location': status_url}
+
+@bp.route('/segmentation/ai-pipeline/jobs/<job_id>', methods=['GET'])
+def get_pipeline_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job_view(job))
+
+@bp.route('/segmentation/ai-pipeline/jobs/<job_id>/events', methods=['GET'])
+def pipeline_job_events(job_id):
+    if jobs.get(job_id) is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+
+    def generate():
+        # The job may run in another worker process, so progress is read back from the queue file
+        sent_steps = 0
+        version = None
+        status = None
+        last_sent = time.monotonic()
+        while True:
+            job = jobs.get(job_id)
+            if job is None:
+                yield sse('error', {'jobId': job_id, 'error': 'Job expired'})
+                return
+            if job['version'] != version:
+                version = job['version']
+                if len(job['steps']) < sent_steps:
+                    # Retried after its worker died: the steps start over
+                    sent_steps = 0
+                if job['status'] != status and job['status'] not in TERMINAL_STATES:
+                    status = job['status']
+                    yield sse('status', {'jobId': job_id, 'status': status, 'attempts': job['attempts']})
+                for step, fields in job['steps'][sent_steps:]:
+                    yield sse('step', dict({'jobId': job_id, 'step': step}, **fields))
+                sent_steps = len(job['steps'])
+                if job['status'] in TERMINAL_STATES:
+                    yield sse('result' if job['status'] == 'done' else 'error', job_view(job))
+                    return
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > JOB_EVENTS_KEEPALIVE_SECONDS:
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(JOB_EVENTS_POLL_SECONDS)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+register_service(bp.name, models=PIPELINE_MODELS, health=lambda: {
+    'cache': result_cache.stats(),
+    'treatments': get_treatment_store().stats(),
+    'gemini': default_client.stats(),
+    'cascade': cascade.stats(),
+    'lesions': lesion_cache.stats(),
+    'jobs': jobs.stats()
+}, on_start=jobs.ensure_started)
+
+app = create_app('Tea Disease Pipeline with Gemini AI', bp)
 
 if __name__ == '__main__':
-    os.makedirs('./uploads', exist_ok=True)
-    os.makedirs('./outputs', exist_ok=True)
     print("Tea Disease Pipeline Server Starting...")
     print("Multi-step analysis: Leaf Type → Health Check → Disease Detection → Severity & Gemini AI Treatment")
     app.run(debug=True, host='0.0.0.0', port=5003)
\ No newline at end of file
@@ -1,79 +1,85 @@
-import os
 import numpy as np
 import cv2
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
+from flask import Blueprint, request, jsonify
+from image_preprocessing import PreprocessedImage
+from model_registry import registry
+from service import create_app, register_service
+from result_cache import ResultCache
+from artifact_store import overlay_response
+from overlay_rendering import full_resolution_requested, decode_full_resolution, blend_mask
+from tiled_inference import tiled_requested, segment_tiled, aggregate_tiles, TILED_MAX_SIDE
+from color_features import ColorAccumulator
+from mask_encoding import mask_format_requested, polygon_tolerance, encode_mask, MASK_FORMATS
+from lesion_features import lesion_features, classify_color_features
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+bp = Blueprint('segmentation', __name__)
 
-MODEL_PATH = './segmentation.h5'
-model = load_model(MODEL_PATH)
+MODEL_VERSION = registry.version('segmentation')
+result_cache = ResultCache()
 
 # Tea leaf diseases for segmentation-based detection
 CLASSES = ['Algal Leaf Spot', 'Grey Blight Disease', 'Brown Blight', 'Red Leaf Spot', 'White Spot']
 
-def preprocess_image(image_path):
-    image = load_img(image_path, target_size=(224, 224))
-    image_array = img_to_array(image) / 255.0
-    return np.expand_dims(image_array, axis=0), image
-
-def predict_disease_from_segmentation(image_path):
-    processed_image, original_image = preprocess_image(image_path)
+def predict_disease_from_segmentation(data):
+    image = PreprocessedImage.from_bytes(data)
     
     # Get segmentation mask
-    segmentation_output = model.predict(processed_image)
+    segmentation_output = registry.get('segmentation').predict(image.tensor)
     
     # If model outputs multiple classes, get predictions
     if len(segmentation_output.shape) > 3 and segmentation_output.shape[-1] == len(CLASSES):
         # Multi-class segmentation
         predictions = np.mean(segmentation_output[0], axis=(0, 1))  # Average across spatial dimensions
         predicted_class = CLASSES[np.argmax(predictions)]
-        accuracy = round(np.max(predictions) * 100, 2)
+        accuracy = round(float(np.max(predictions)) * 100, 2)
     else:
         # Binary segmentation - analyze the segmented regions to classify disease
         mask = (segmentation_output[0] > 0.5).astype(np.uint8)
         
-        # Analyze segmented regions to determine disease type
-        original_array = np.array(original_image)
-        segmented_regions = original_array[mask[:, :, 0] > 0]
-        
-        if len(segmented_regions) > 0:
+        if mask.any():
             # Analyze color characteristics of segmented regions
-            predicted_class, accuracy = analyze_disease_characteristics(segmented_regions)
+            predicted_class, accuracy = analyze_disease_characteristics(image.hsv, mask)
         else:
             predicted_class = "No Disease Detected"
             accuracy = 0.0
     
-    return predicted_class, accuracy, segmentation_output[0], original_image
+    return predicted_class, accuracy, segmentation_output[0], image
 
-def analyze_disease_characteristics(segmented_regions):
-    """Analyze color characteristics of segmented regions to determine disease type"""
-    # Convert to HSV for better color analysis
-    hsv_regions = cv2.cvtColor(segmented_regions.reshape(-1, 1, 3), cv2.COLOR_RGB2HSV)
-    
-    # Calculate average hue, saturation, and value
-    avg_hue = np.mean(hsv_regions[:, 0, 0])
-    avg_saturation = np.mean(hsv_regions[:, 0, 1])
-    avg_value = np.mean(hsv_regions[:, 0, 2])
-    
-    # Disease classification based on color characteristics
-    if avg_hue < 15 or avg_hue > 165:  # Red range
-        if avg_saturation > 100:
-            return "Red Leaf Spot", 85.0 + np.random.uniform(0, 10)
-        else:
-            return "Algal Leaf Spot", 80.0 + np.random.uniform(0, 15)
-    elif 15 <= avg_hue < 30:  # Orange/Brown range
-        if avg_value < 100:
-            return "Brown Blight", 88.0 + np.random.uniform(0, 10)
+def analyze_disease_characteristics(hsv, mask):
+    """Classify the disease from the colour of the masked lesions of an HSV image"""
+    return classify_color_features(lesion_features(hsv, mask))
+
+def predict_disease_tiled(data):
+    """Segment overlapping full-resolution tiles and classify the stitched lesion pixels.
+
+    The colour features of the lesions are accumulated band by band while the
+    mask is stitched, so the full-resolution HSV image is never materialised.
+    """
+    image = decode_full_resolution(data, TILED_MAX_SIDE)
+    lesions = ColorAccumulator()
+
+    def add_band(y0, y1, band):
+        if band.shape[-1] == 1:
+            lesions.add(cv2.cvtColor(np.ascontiguousarray(image[y0:y1]), cv2.COLOR_RGB2HSV), band[:, :, 0] > 127)
+
+    mask, tiles = segment_tiled(image, on_band=add_band)
+    if mask.shape[-1] == len(CLASSES):
+        summary = aggregate_tiles(tiles, CLASSES)
+        predicted_class = max(summary['max_scores'], key=summary['max_scores'].get)
+        accuracy = summary['max_scores'][predicted_class]
+    else:
+        summary = aggregate_tiles(tiles, ['Lesion'])
+        summary['lesion_fraction'] = round(lesions.count / float(image.shape[0] * image.shape[1]), 4)
+        if lesions.count:
+            predicted_class, accuracy = classify_color_features(lesions.features())
         else:
-            return "Algal Leaf Spot", 82.0 + np.random.uniform(0, 12)
-    elif avg_value < 80:  # Dark regions
-        return "Grey Blight Disease", 86.0 + np.random.uniform(0, 10)
-    else:  # Light regions
-        return "White Spot", 84.0 + np.random.uniform(0, 12)
+            predicted_class = "No Disease Detected"
+            accuracy = 0.0
+    return predicted_class, accuracy, mask, image, summary
+
+def render_tiled_segmented_image(source):
+    image, mask = source
+    return blend_mask(image, mask)
 
 def apply_segmentation_mask(original_image, mask):
     # Convert original image to numpy array if it isn't already
@@ -90,7 +96,28 @@ def apply_segmentation_mask(original_image, mask):
     segmented_image = cv2.addWeighted(original_image, 0.7, overlay, 0.3, 0)
     return segmented_image
 
-@app.route('/segmentation', methods=['POST'])
+def render_segmented_image(source):
+    original_image, mask = source
+    return apply_segmentation_mask(original_image, mask)
+
+def render_cached_segmented_image(source):
+    """Overlay of a cached result, from the upload and the mask kept in the cache"""
+    data, mask = source
+    return apply_segmentation_mask(PreprocessedImage.from_bytes(data).rgb, mask)
+
+def render_full_resolution_segmented_image(source):
+    """The model-resolution mask upsampled onto the original photo"""
+    data, mask = source
+    return blend_mask(decode_full_resolution(data), mask)
+
+def segmented_image_url(data, mask, original_image=None):
+    if full_resolution_requested(request):
+        return overlay_response(request, render_full_resolution_segmented_image, (data, mask), 'segmented_image')
+    if original_image is None:
+        return overlay_response(request, render_cached_segmented_image, (data, mask), 'segmented_image')
+    return overlay_response(request, render_segmented_image, (original_image, mask), 'segmented_image')
+
+@bp.route('/segmentation', methods=['POST'])
 def predict():
     if 'file' not in request.files and 'image' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
@@ -100,37 +127,66 @@ def predict():
     if not file or file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
 
-    file_path = os.path.join('./uploads', file.filename)
-    file.save(file_path)
+    data = file.read()
 
-    try:
-        predicted_disease, accuracy, mask, original_image = predict_disease_from_segmentation(file_path)
-        segmented_image = apply_segmentation_mask(original_image, mask)
+    # ?mask_format=rle|bitpack: the mask as geometry (no overlay image) for clients that map lesions
+    mask_format = mask_format_requested(request)
+    if mask_format and mask_format not in MASK_FORMATS:
+        return jsonify({'error': f"Unknown mask format '{mask_format}', use one of {', '.join(MASK_FORMATS)}"}), 400
+    if mask_format and tiled_requested(request):
+        return jsonify({'error': 'mask_format is not supported with tiled=1'}), 400
 
-        output_image_path = os.path.join('./outputs', 'segmented_image.png')
-        cv2.imwrite(output_image_path, cv2.cvtColor(segmented_image, cv2.COLOR_RGB2BGR))
-        print(f"Segmented image saved at: {output_image_path}")  # Debugging
+    # Tiled mode reads the full-resolution photo; its results depend on the tile settings, so it skips the cache
+    if tiled_requested(request):
+        try:
+            predicted_disease, accuracy, mask, image, summary = predict_disease_tiled(data)
+            response = {
+                'disease': predicted_disease,
+                'accuracy': accuracy,
+                'tiles': summary,
+                'segmented_image': overlay_response(request, render_tiled_segmented_image, (image, mask), 'segmented_image')
+            }
+            return jsonify(response)
+        except Exception as e:
+            print(f"Error during tiled prediction: {str(e)}")  # Debugging
+            return jsonify({'error': str(e)}), 500
+
+    # Byte-identical re-uploads are answered from the cache without running the model;
+    # the cache keeps the thresholded mask so the overlay can be redrawn if fetched
+    cache_key = result_cache.make_key('segmentation-mask', data, MODEL_VERSION)
+    cached = result_cache.get(cache_key)
+    if cached is not None and cached[1] is not None:
+        response, mask_png = cached
+        mask = cv2.imdecode(np.frombuffer(mask_png, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if mask_format:
+            hsv = PreprocessedImage.from_bytes(data).hsv
+            return jsonify(dict(response, mask=encode_mask(mask // 255, mask_format, hsv, polygon_tolerance(request))))
+        response = dict(response, segmented_image=segmented_image_url(data, mask / 255.0))
+        return jsonify(response)
+
+    try:
+        predicted_disease, accuracy, mask, image = predict_disease_from_segmentation(data)
 
         response = {
             'disease': predicted_disease,
-            'accuracy': accuracy,
-            'segmented_image': f'http://127.0.0.1:5001/outputs/segmented_image.png'
+            'accuracy': accuracy
         }
+        binary_mask = ((mask[:, :, 0] if mask.ndim == 3 else mask) > 0.5).astype(np.uint8)
+        result_cache.put(cache_key, response, cv2.imencode('.png', binary_mask * 255)[1].tobytes())
+        if mask_format:
+            return jsonify(dict(response, mask=encode_mask(binary_mask, mask_format, image.hsv, polygon_tolerance(request))))
+        # Each request gets its own overlay, drawn only when the client fetches it
+        response = dict(response, segmented_image=segmented_image_url(data, mask, image.rgb))
         return jsonify(response)
     except Exception as e:
         print(f"Error during prediction: {str(e)}")  # Debugging
         return jsonify({'error': str(e)}), 500
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
-@app.route('/outputs/<filename>')
-def serve_image(filename):
-    return send_from_directory('./outputs', filename)
+register_service(bp.name, models=['segmentation'], health=lambda: {'cache': result_cache.stats()})
+
+app = create_app('Tea Disease Segmentation', bp)
 
 if __name__ == '__main__':
-    os.makedirs('./uploads', exist_ok=True)
-    os.makedirs('./outputs', exist_ok=True)
     print("Tea Disease Segmentation Server Starting...")
     print(f"Detecting diseases: {', '.join(CLASSES)}")
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
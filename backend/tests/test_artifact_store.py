@@ -0,0 +1,62 @@
+import time
+import threading
+import numpy as np
+from artifact_store import ArtifactStore
+
+# Rendering overlays on first fetch: concurrent fetches, caching and eviction
+#   cd backend && python -m pytest tests
+
+
+def slow_render(calls):
+    def render(source):
+        calls.append(source)
+        time.sleep(0.1)
+        return np.full((8, 8, 3), source, dtype=np.uint8)
+    return render
+
+
+def test_concurrent_first_fetches_render_once():
+    store = ArtifactStore(shared_dir=None)
+    calls = []
+    filename = store.add(slow_render(calls), 200)
+    results, errors = [], []
+
+    def fetch():
+        try:
+            results.append(store.get(filename))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(results) == 8
+    assert len({data for data, _ in results}) == 1
+    assert all(mimetype == 'image/png' for _, mimetype in results)
+    assert calls == [200]
+    assert store.stats()['rendered'] == 1
+    assert store.stats()['served'] == 8
+
+
+def test_rendered_overlay_replaces_source_size():
+    store = ArtifactStore(shared_dir=None)
+    source = np.zeros((64, 64, 3), dtype=np.uint8)
+    filename = store.add(lambda rgb: rgb, source)
+    assert store.size == source.nbytes
+
+    data, _ = store.get(filename)
+    assert store.size == len(data)
+    assert store.get(filename)[0] == data
+
+
+def test_expired_and_unknown_overlays_are_not_served():
+    store = ArtifactStore(ttl_seconds=0.05, shared_dir=None)
+    filename = store.add(slow_render([]), 10)
+    time.sleep(0.1)
+    assert store.get(filename) is None
+    assert store.get('overlay-missing.png') is None
+    assert store.stats()['entries'] == 0
@@ -0,0 +1,58 @@
+import threading
+import numpy as np
+import pytest
+from batching import BatchingPredictor
+
+# Concurrent predict calls for one model share forward passes
+#   cd backend && python -m pytest tests
+
+
+class RecordingModel:
+    """Doubles its input and records the size of every batch it ran"""
+
+    def __init__(self, fail_on=None):
+        self.batch_sizes = []
+        self.fail_on = fail_on
+
+    def predict_on_batch(self, inputs):
+        self.batch_sizes.append(len(inputs))
+        if self.fail_on is not None and (inputs == self.fail_on).any():
+            raise ValueError('bad input')
+        return inputs * 2
+
+
+def test_concurrent_calls_share_batches_and_get_their_own_rows():
+    model = RecordingModel()
+    predictor = BatchingPredictor(model, 'test', max_batch_size=8, max_wait_ms=50)
+    results = {}
+    start = threading.Barrier(8)
+
+    def call(index):
+        start.wait()
+        results[index] = predictor.predict(np.full((1, 2), index, dtype=np.float32))
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for index in range(8):
+        assert np.array_equal(results[index], np.full((1, 2), index * 2, dtype=np.float32))
+    assert sum(model.batch_sizes) == 8
+    assert len(model.batch_sizes) < 8
+
+
+def test_multi_row_inputs_are_split_back():
+    predictor = BatchingPredictor(RecordingModel(), 'test', max_batch_size=8, max_wait_ms=50)
+    first = predictor.submit(np.arange(3, dtype=np.float32).reshape(3, 1))
+    second = predictor.submit(np.arange(3, 5, dtype=np.float32).reshape(2, 1))
+    assert first.result().ravel().tolist() == [0, 2, 4]
+    assert second.result().ravel().tolist() == [6, 8]
+
+
+def test_failed_batch_fails_its_callers_and_the_worker_goes_on():
+    predictor = BatchingPredictor(RecordingModel(fail_on=-1), 'test', max_batch_size=8, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        predictor.predict(np.full((1, 1), -1, dtype=np.float32))
+    assert predictor.predict(np.ones((1, 1), dtype=np.float32)).tolist() == [[2.0]]
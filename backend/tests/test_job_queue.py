@@ -0,0 +1,92 @@
+import time
+import sqlite3
+import pytest
+import tracing
+from job_queue import JobQueue
+
+# Worker behaviour of the persistent job queue, on a queue file per test
+#   cd backend && python -m pytest tests
+
+
+@pytest.fixture
+def make_queue(tmp_path, monkeypatch):
+    # Each queue registers its metrics; drop them again with the test's queue file
+    monkeypatch.setattr(tracing, 'METRICS', list(tracing.METRICS))
+
+    def make(handler, **settings):
+        queue = JobQueue(handler, path=str(tmp_path / 'jobs.sqlite3'), **settings)
+        queue.ensure_started()
+        return queue
+    return make
+
+
+def wait_for_status(queue, job_id, status, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while queue.get(job_id)['status'] != status:
+        assert time.monotonic() < deadline, f'job {job_id} is {queue.get(job_id)["status"]}, not {status}'
+        time.sleep(0.02)
+    return queue.get(job_id)
+
+
+def echo(upload, on_step):
+    on_step('length', {'bytes': len(upload)})
+    return {'upload': upload.decode()}
+
+
+def test_runs_job_and_records_steps(make_queue):
+    queue = make_queue(echo, workers=1)
+    job = wait_for_status(queue, queue.submit(b'leaf'), 'done')
+    assert job['steps'] == [['length', {'bytes': 4}]]
+    assert job['result'] == {'upload': 'leaf'}
+
+
+def test_worker_survives_failure_to_finish(make_queue):
+    queue = make_queue(echo, workers=1, lease_seconds=0.3)
+    finish = queue._finish
+    failures = []
+
+    def flaky_finish(job_id, status, result=None, error=None):
+        if not failures:
+            failures.append(job_id)
+            raise sqlite3.OperationalError('database is locked')
+        finish(job_id, status, result, error)
+    queue._finish = flaky_finish
+
+    first = queue.submit(b'first')
+    # The only worker is still alive and takes the next job
+    wait_for_status(queue, queue.submit(b'second'), 'done')
+    assert failures == [first]
+    # The unrecorded job was left leased and runs again once the lease expires
+    job = wait_for_status(queue, first, 'done')
+    assert job['attempts'] == 2
+    assert job['result'] == {'upload': 'first'}
+
+
+def test_unserializable_result_fails_only_that_job(make_queue):
+    queue = make_queue(lambda upload, on_step: {'value': object()} if upload == b'bad' else {'ok': True}, workers=1)
+    job = wait_for_status(queue, queue.submit(b'bad'), 'failed')
+    assert 'not JSON serializable' in job['error']
+    assert wait_for_status(queue, queue.submit(b'good'), 'done')['result'] == {'ok': True}
+    assert queue.stats()['failed'] == 1 and queue.stats()['completed'] == 1
+
+
+def test_submit_params_reach_handler(make_queue):
+    queue = make_queue(lambda upload, on_step, region='': {'region': region}, workers=1)
+    assert wait_for_status(queue, queue.submit(b'leaf', region='Assam'), 'done')['result'] == {'region': 'Assam'}
+    assert wait_for_status(queue, queue.submit(b'leaf'), 'done')['result'] == {'region': ''}
+
+
+def test_queue_file_without_params_is_migrated(make_queue, tmp_path):
+    # A queue file from before jobs stored their parameters, with a job still waiting
+    conn = sqlite3.connect(str(tmp_path / 'jobs.sqlite3'))
+    conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, "
+                 "started_at REAL, finished_at REAL, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+                 "version INTEGER NOT NULL DEFAULT 0, upload BLOB, steps TEXT NOT NULL DEFAULT '[]', "
+                 "result TEXT, error TEXT)")
+    conn.execute("INSERT INTO jobs (id, status, created_at, upload) VALUES ('old', 'queued', ?, ?)",
+                 (time.time(), b'leaf'))
+    conn.commit()
+    conn.close()
+
+    queue = make_queue(echo, workers=1)
+    assert wait_for_status(queue, 'old', 'done')['result'] == {'upload': 'leaf'}
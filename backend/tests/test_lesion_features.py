@@ -0,0 +1,58 @@
+import threading
+import numpy as np
+from lesion_features import LesionFeatureCache, extract_lesion_features
+
+# Per-lesion features from an HSV image and a lesion mask, and their cache
+#   cd backend && python -m pytest tests
+
+
+def two_lesion_image():
+    rng = np.random.default_rng(0)
+    hsv = rng.integers(0, 256, size=(40, 60, 3), dtype=np.uint8)
+    mask = np.zeros((40, 60), dtype=np.uint8)
+    mask[5:15, 5:25] = 1     # 200 pixels
+    mask[25:30, 40:44] = 1   # 20 pixels
+    mask[35, 2] = 1          # below min_area
+    return hsv, mask
+
+
+def test_lesion_means_match_masked_pixels():
+    hsv, mask = two_lesion_image()
+    features = extract_lesion_features(hsv, mask, min_area=4)
+
+    assert features['area'] == 221
+    assert np.allclose([features['mean_hue'], features['mean_saturation'], features['mean_value']],
+                       hsv[mask > 0].mean(axis=0))
+    assert [lesion['area'] for lesion in features['lesions']] == [200, 20]
+    largest, smaller = features['lesions']
+    assert largest['bbox'] == [5, 5, 20, 10]
+    assert np.allclose(largest['mean_hsv'], hsv[5:15, 5:25].reshape(-1, 3).mean(axis=0), atol=0.005)
+    assert np.allclose(smaller['mean_hsv'], hsv[25:30, 40:44].reshape(-1, 3).mean(axis=0), atol=0.005)
+
+
+def test_empty_mask_has_no_lesions():
+    hsv, _ = two_lesion_image()
+    features = extract_lesion_features(hsv, np.zeros(hsv.shape[:2], dtype=np.float32))
+    assert features['area'] == 0 and features['lesions'] == []
+    assert features['mean_hue'] == 0.0
+
+
+def test_cache_counts_every_lookup_under_concurrency():
+    cache = LesionFeatureCache(max_entries=4)
+    hsv, mask = two_lesion_image()
+    images = [np.roll(hsv, shift, axis=1) for shift in range(8)]
+
+    def lookups():
+        for _ in range(25):
+            for image in images:
+                cache.get(image, mask)
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 8 * 25 * len(images)
+    assert stats['entries'] == 4
@@ -0,0 +1,51 @@
+import base64
+import numpy as np
+import pytest
+from mask_encoding import run_lengths, bitpack, polygons, encode_mask
+
+# Compact lesion mask encodings and what a client needs to decode them
+#   cd backend && python -m pytest tests
+
+
+def decode_rle(counts, size):
+    values = np.concatenate([np.full(count, index % 2, dtype=np.uint8) for index, count in enumerate(counts)])
+    return values.reshape(size)
+
+
+def decode_bitpack(data, size):
+    bits = np.unpackbits(np.frombuffer(base64.b64decode(data), dtype=np.uint8))
+    return bits[:size[0] * size[1]].reshape(size)
+
+
+@pytest.mark.parametrize('first', [0, 1])
+def test_encodings_round_trip(first):
+    mask = (np.random.default_rng(first).random((13, 21)) > 0.6).astype(np.uint8)
+    mask[0, 0] = first
+    assert np.array_equal(decode_rle(run_lengths(mask), mask.shape), mask)
+    assert np.array_equal(decode_bitpack(bitpack(mask), mask.shape), mask)
+
+
+def test_run_lengths_start_with_zeros():
+    assert run_lengths(np.array([[1, 1, 0]], dtype=np.uint8)) == [0, 2, 1]
+    assert run_lengths(np.zeros((2, 2), dtype=np.uint8)) == [4]
+
+
+def test_polygons_largest_first():
+    mask = np.zeros((40, 40), dtype=np.uint8)
+    mask[2:6, 2:6] = 1
+    mask[10:30, 10:30] = 1
+    found = polygons(mask)
+    assert len(found) == 2
+    assert sorted(found[0]) == [[10, 10], [10, 29], [29, 10], [29, 29]]
+
+
+def test_encode_mask_section():
+    mask = np.zeros((20, 30), dtype=np.uint8)
+    mask[5:10, 5:15] = 1
+    hsv = np.full((20, 30, 3), 100, dtype=np.uint8)
+    section = encode_mask(mask, 'rle', hsv)
+    assert section['size'] == [20, 30]
+    assert np.array_equal(decode_rle(section['counts'], (20, 30)), mask)
+    assert section['areaFraction'] == round(50 / 600, 6)
+    assert section['regions'] == [{'area': 50, 'meanHsv': [100.0, 100.0, 100.0],
+                                   'bbox': [5, 5, 10, 5], 'centroid': [9.5, 7.0]}]
@@ -0,0 +1,48 @@
+import os
+import time
+from result_cache import ResultCache
+
+# The two-tier result cache: memory LRU and the optional disk directory
+#   cd backend && python -m pytest tests
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, cache_dir='')
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == ({'n': 1}, None)
+    cache.put('c', {'n': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['hits'] == 3 and cache.stats()['misses'] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = ResultCache(ttl_seconds=0.05, cache_dir='')
+    cache.put('a', {'n': 1})
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    ResultCache(cache_dir=str(tmp_path)).put('key', {'disease': 'White Spot'}, b'\x89PNG')
+    # Written under temporary names and renamed: nothing partial is left behind
+    assert sorted(os.listdir(tmp_path)) == ['key.json', 'key.png']
+
+    reloaded = ResultCache(cache_dir=str(tmp_path))
+    assert reloaded.get('key') == ({'disease': 'White Spot'}, b'\x89PNG')
+    assert reloaded.stats()['entries'] == 1
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    (tmp_path / 'key.json').write_text('{not json')
+    assert ResultCache(cache_dir=str(tmp_path)).get('key') is None
+
+
+def test_keys_change_with_upload_and_model_version():
+    cache = ResultCache(cache_dir='')
+    key = cache.make_key('severity', b'image', 'v1')
+    assert key == cache.make_key('severity', b'image', 'v1')
+    assert key != cache.make_key('severity', b'image', 'v2')
+    assert key != cache.make_key('severity', b'other', 'v1')
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import tiled_inference
+from batching import BatchingPredictor
+from tiled_inference import segment_tiled, tile_positions, aggregate_tiles
+
+# Stitching overlapping tiles back into one mask, with a stand-in segmentation model
+#   cd backend && python -m pytest tests
+
+
+class IdentityModel:
+    """'Segments' each tile as its own red channel, so a correct stitch reproduces the source"""
+    input_shape = (None, 64, 64, 3)
+
+    def predict_on_batch(self, inputs):
+        return inputs[..., :1]
+
+
+class FakeRegistry:
+    def __init__(self):
+        self.predictor = BatchingPredictor(IdentityModel(), 'segmentation', max_wait_ms=1)
+
+    def get(self, name):
+        return self.predictor
+
+
+@pytest.fixture(autouse=True)
+def fake_registry(monkeypatch):
+    monkeypatch.setattr(tiled_inference, 'registry', FakeRegistry())
+
+
+def source_image(height, width):
+    return np.random.default_rng(0).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def test_tile_positions_cover_the_edge():
+    assert tile_positions(50, 64, 48) == [0]
+    assert tile_positions(200, 64, 48) == [0, 48, 96, 136]
+
+
+@pytest.mark.parametrize('shape', [(150, 230), (64, 64), (40, 300)])
+def test_stitched_mask_matches_source(shape):
+    image = source_image(*shape)
+    bands = []
+    mask, tiles = segment_tiled(image, tile=64, overlap=0.25, batch_size=4,
+                                on_band=lambda y0, y1, band: bands.append((y0, y1, band.shape)))
+
+    assert mask.shape == shape + (1,)
+    assert np.abs(mask[..., 0].astype(int) - image[..., 0]).max() <= 1
+    # Every row is finalised exactly once, in order
+    assert bands[0][0] == 0 and bands[-1][1] == shape[0]
+    assert all(previous[1] == current[0] for previous, current in zip(bands, bands[1:]))
+    assert all(band_shape == (y1 - y0, shape[1], 1) for y0, y1, band_shape in bands)
+    assert len(tiles) == len(tile_positions(shape[0], 64, 48)) * len(tile_positions(shape[1], 64, 48))
+
+
+def test_large_masks_are_memory_mapped(monkeypatch):
+    monkeypatch.setattr(tiled_inference, 'TILED_MEMMAP_PIXELS', 100)
+    image = source_image(100, 120)
+    mask, _ = segment_tiled(image, tile=64, overlap=0.25)
+    assert isinstance(mask, np.memmap)
+    assert np.abs(mask[..., 0].astype(int) - image[..., 0]).max() <= 1
+
+
+def test_aggregate_picks_the_most_confident_tile():
+    tiles = [{'x': 0, 'y': 0, 'width': 64, 'height': 64, 'scores': [0.2, 0.1]},
+             {'x': 48, 'y': 0, 'width': 64, 'height': 64, 'scores': [0.1, 0.9]}]
+    summary = aggregate_tiles(tiles, ['a', 'b'], top=1)
+    assert summary['max_scores'] == {'a': 20.0, 'b': 90.0}
+    assert summary['hotspots'] == [{'x': 48, 'y': 0, 'width': 64, 'height': 64, 'label': 'b', 'score': 90.0}]
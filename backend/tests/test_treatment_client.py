@@ -0,0 +1,125 @@
+import time
+import pytest
+import treatment_client
+from gemini_stub import start_stub_server
+from treatment_client import TreatmentClient, TREATMENT_UNAVAILABLE
+from treatment_store import TreatmentStore
+
+# Retry, circuit breaker and fallback behaviour of the Gemini client against the local
+# stub server (gemini_stub.py); no network access or API key needed:
+#   cd backend && python -m pytest tests
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**settings):
+        server, url = start_stub_server(**settings)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # Retries sleep a random share of an exponential backoff; the tests need not wait
+    monkeypatch.setattr(treatment_client.random, 'uniform', lambda low, high: 0.0)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retries_retryable_status(stub, status):
+    server, url = stub(fail_first=2, failure_status=status)
+    client = TreatmentClient(api_url=url, max_retries=2)
+
+    treatment = client.get_treatment('Brown Blight', 'Mild')
+
+    assert treatment.startswith('Stub treatment for Brown Blight (Mild)')
+    assert server.request_count == 3
+    assert client.retries == 2
+    assert client.state() == 'closed'
+
+
+def test_falls_back_after_retries(stub):
+    server, url = stub(failure_rate=1.0)
+    client = TreatmentClient(api_url=url, max_retries=2)
+
+    assert client.get_treatment('Brown Blight', 'Mild') == TREATMENT_UNAVAILABLE
+    assert server.request_count == 3
+    assert client.fallbacks == 1
+
+
+def test_does_not_retry_client_errors(stub):
+    server, url = stub(failure_rate=1.0, failure_status=400)
+    client = TreatmentClient(api_url=url, max_retries=2)
+
+    assert client.get_treatment('Brown Blight', 'Mild') == TREATMENT_UNAVAILABLE
+    assert server.request_count == 1
+
+
+def test_breaker_opens_and_recovers(stub):
+    server, url = stub(failure_rate=1.0)
+    client = TreatmentClient(api_url=url, max_retries=0, breaker_threshold=2, breaker_cooldown=0.2)
+
+    for _ in range(2):
+        assert client.get_treatment('White Spot', 'Severe') == TREATMENT_UNAVAILABLE
+    assert client.state() == 'open'
+
+    # Open: answered with the fallback without calling the API
+    assert client.get_treatment('White Spot', 'Severe') == TREATMENT_UNAVAILABLE
+    assert server.request_count == 2
+
+    # After the cooldown one probe goes out; its success closes the circuit
+    server.RequestHandlerClass.failure_rate = 0.0
+    time.sleep(0.25)
+    assert client.state() == 'half-open'
+    assert client.get_treatment('White Spot', 'Severe').startswith('Stub treatment for White Spot (Severe)')
+    assert client.state() == 'closed'
+    assert server.request_count == 3
+
+
+def test_failed_probe_reopens_breaker(stub):
+    server, url = stub(failure_rate=1.0)
+    client = TreatmentClient(api_url=url, max_retries=0, breaker_threshold=1, breaker_cooldown=0.2)
+
+    client.get_treatment('White Spot', 'Severe')
+    time.sleep(0.25)
+    assert client.state() == 'half-open'
+    assert client.get_treatment('White Spot', 'Severe') == TREATMENT_UNAVAILABLE
+    assert client.state() == 'open'
+    assert server.request_count == 2
+
+
+def test_store_serves_fallback_then_background_fill(stub, tmp_path):
+    server, url = stub(failure_rate=1.0)
+    client = TreatmentClient(api_url=url, max_retries=0, breaker_threshold=100)
+    path = str(tmp_path / 'treatments.sqlite3')
+    store = TreatmentStore(path=path, fetch=client.get_treatment)
+
+    # A miss never waits on the API; a failed background fetch stores nothing
+    assert store.get('Red Leaf Spot', 'Moderate') == TREATMENT_UNAVAILABLE
+    wait_for(lambda: server.request_count == 1 and not store._refreshing)
+    assert store.stats()['entries'] == 0
+
+    # Once the API answers, the background fetch fills the index for later requests
+    server.RequestHandlerClass.failure_rate = 0.0
+    assert store.get('Red Leaf Spot', 'Moderate') == TREATMENT_UNAVAILABLE
+    wait_for(lambda: store.stats()['entries'] == 1)
+    assert store.get('Red Leaf Spot', 'Moderate').startswith('Stub treatment for Red Leaf Spot (Moderate)')
+    assert server.request_count == 2
+
+    # Persisted: a new process reads it from the index without calling the API
+    reloaded = TreatmentStore(path=path, fetch=client.get_treatment)
+    assert reloaded.get('Red Leaf Spot', 'Moderate').startswith('Stub treatment for Red Leaf Spot (Moderate)')
+    assert server.request_count == 2
@@ -0,0 +1,221 @@
+import os
+import json
+import argparse
+import tempfile
+import numpy as np
+import cv2
+from model_registry import registry
+from overlay_rendering import decode_full_resolution
+
+# Tiled mode: the image is cut into overlapping TILE_SIZE windows of source pixels
+# (resized to the model input only if they differ), so small lesions keep their detail
+TILE_SIZE = int(os.getenv('TILE_SIZE', '224'))
+TILE_OVERLAP = float(os.getenv('TILE_OVERLAP', '0.25'))
+TILE_BATCH_SIZE = int(os.getenv('TILE_BATCH_SIZE', '16'))
+TILED_MAX_SIDE = int(os.getenv('TILED_MAX_SIDE', '8192'))
+# Stitched masks larger than this many pixels are backed by an anonymous temp file
+TILED_MEMMAP_PIXELS = int(os.getenv('TILED_MEMMAP_PIXELS', str(16 * 1024 * 1024)))
+
+
+def tiled_requested(request):
+    """True when the client asked for ?tiled=1"""
+    return request.values.get('tiled', '0').lower() in ('1', 'true', 'yes')
+
+
+def load_source(path):
+    """Image for tiling: .npy rasters are memory-mapped, anything else is decoded with PIL"""
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    with open(path, 'rb') as f:
+        return decode_full_resolution(f.read(), TILED_MAX_SIDE)
+
+
+def tile_positions(length, tile, stride):
+    """Start offsets covering [0, length), the last tile flush with the far edge"""
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile, stride))
+    positions.append(length - tile)
+    return positions
+
+
+def tile_grid(shape, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    stride = max(1, int(round(tile * (1 - overlap))))
+    return tile_positions(shape[0], tile, stride), tile_positions(shape[1], tile, stride)
+
+
+def blend_window(height, width):
+    """Weights falling off towards a tile's edges so overlapping predictions cross-fade"""
+    def ramp(size):
+        steps = np.arange(size)
+        values = np.minimum(steps + 1, size - steps).astype(np.float32)
+        return values / values.max()
+    return np.outer(ramp(height), ramp(width))
+
+
+def model_input_size(name):
+    """(height, width) the model was built for"""
+    shape = registry.get(name).model.input_shape
+    return shape[1], shape[2]
+
+
+def iter_tile_rows(image, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Yield (y, [(x, pixels), ...]) per row of tiles; pixels are views, so a memmap only reads what is sliced"""
+    ys, xs = tile_grid(image.shape, tile, overlap)
+    for y in ys:
+        yield y, [(x, image[y:y + tile, x:x + tile]) for x in xs]
+
+
+def prepare_tile(pixels, tile, input_size):
+    """Float32 model input for one tile: zero-padded at the image edge, resized if tile != input"""
+    pixels = np.asarray(pixels, dtype=np.uint8)
+    height, width = pixels.shape[:2]
+    if height < tile or width < tile:
+        pixels = np.pad(pixels, ((0, tile - height), (0, tile - width), (0, 0)))
+    if (tile, tile) != tuple(input_size):
+        pixels = cv2.resize(pixels, (input_size[1], input_size[0]), interpolation=cv2.INTER_AREA)
+    return pixels.astype(np.float32) / 255.0
+
+
+def predict_tiles(name, tiles, tile, batch_size=TILE_BATCH_SIZE):
+    """Model outputs for a list of tile pixel arrays, run through the batcher in chunks"""
+    input_size = model_input_size(name)
+    model = registry.get(name)
+    # Submit every chunk first so the batcher can keep the model busy
+    futures = [model.submit(np.stack([prepare_tile(pixels, tile, input_size) for pixels in tiles[start:start + batch_size]]))
+               for start in range(0, len(tiles), batch_size)]
+    return np.concatenate([future.result() for future in futures])
+
+
+def allocate(shape, dtype=np.uint8):
+    """Zeroed output array; big ones live in an anonymous temp file instead of RAM"""
+    if shape[0] * shape[1] <= TILED_MEMMAP_PIXELS:
+        return np.zeros(shape, dtype=dtype)
+    with tempfile.TemporaryFile() as f:
+        return np.memmap(f, dtype=dtype, mode='w+', shape=shape)
+
+
+def segment_tiled(image, name='segmentation', tile=TILE_SIZE, overlap=TILE_OVERLAP,
+                  batch_size=TILE_BATCH_SIZE, out=None, on_band=None):
+    """Stitched segmentation of an image of any size, plus per-tile lesion scores.
+
+    Each row of tiles is predicted in batches and blended into a rolling
+    accumulator one tile high. Rows no later tile can reach are finalised into
+    `out` (uint8, 0-255 per channel) and handed to on_band(y0, y1, mask_band), so
+    apart from the source and the result, memory stays at one band of tiles.
+    """
+    height, width = image.shape[:2]
+    band_height = min(tile, height)
+    accumulator = None
+    weights = np.zeros((band_height, width), dtype=np.float32)
+    band_top = 0
+    tiles = []
+
+    def emit(rows):
+        nonlocal band_top
+        band = accumulator[:rows] / np.maximum(weights[:rows], 1e-6)[:, :, None]
+        band = np.clip(band * 255.0 + 0.5, 0, 255).astype(np.uint8)
+        out[band_top:band_top + rows] = band
+        if on_band is not None:
+            on_band(band_top, band_top + rows, band)
+        # Slide the band down; numpy buffers the overlapping copy
+        accumulator[:-rows] = accumulator[rows:]
+        accumulator[-rows:] = 0
+        weights[:-rows] = weights[rows:]
+        weights[-rows:] = 0
+        band_top += rows
+
+    for y, row in iter_tile_rows(image, tile, overlap):
+        if y > band_top:
+            emit(y - band_top)
+        outputs = predict_tiles(name, [pixels for _, pixels in row], tile, batch_size)
+        if outputs.ndim == 3:
+            outputs = outputs[..., None]
+        if accumulator is None:
+            channels = outputs.shape[-1]
+            accumulator = np.zeros((band_height, width, channels), dtype=np.float32)
+            if out is None:
+                out = allocate((height, width, channels))
+        for (x, pixels), output in zip(row, outputs):
+            tile_height, tile_width = pixels.shape[:2]
+            if output.shape[:2] != (tile, tile):
+                output = cv2.resize(output, (tile, tile), interpolation=cv2.INTER_LINEAR)
+                if output.ndim == 2:
+                    output = output[:, :, None]
+            output = output[:tile_height, :tile_width]
+            window = blend_window(tile_height, tile_width)
+            accumulator[:tile_height, x:x + tile_width] += output * window[:, :, None]
+            weights[:tile_height, x:x + tile_width] += window
+            tiles.append({
+                'x': int(x), 'y': int(y), 'width': int(tile_width), 'height': int(tile_height),
+                # Binary models: share of the tile above 0.5; multi-class: mean score per channel
+                'scores': [float(np.mean(output[..., 0] > 0.5))] if output.shape[-1] == 1
+                          else [float(value) for value in output.mean(axis=(0, 1))]
+            })
+    emit(height - band_top)
+    return out, tiles
+
+
+def classify_tiled(image, name='tea_classifier', tile=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE):
+    """Class scores of every overlapping tile, as a list of per-tile dicts"""
+    tiles = []
+    for y, row in iter_tile_rows(image, tile, overlap):
+        outputs = predict_tiles(name, [pixels for _, pixels in row], tile, batch_size)
+        for (x, pixels), output in zip(row, outputs):
+            tiles.append({
+                'x': int(x), 'y': int(y), 'width': int(pixels.shape[1]), 'height': int(pixels.shape[0]),
+                'scores': [float(value) for value in np.ravel(output)]
+            })
+    return tiles
+
+
+def aggregate_tiles(tiles, classes, top=5):
+    """Per-class max and mean over tiles, and the tiles that scored highest.
+
+    Lesions are small relative to a plantation image, so the prediction is the
+    class with the single most confident tile rather than the image-wide mean.
+    """
+    scores = np.array([tile['scores'] for tile in tiles], dtype=np.float64)
+    best = scores.max(axis=0)
+    order = np.argsort(-scores.max(axis=1), kind='stable')[:top]
+    return {
+        'tile_count': len(tiles),
+        'max_scores': {name: round(float(best[i]) * 100, 2) for i, name in enumerate(classes)},
+        'mean_scores': {name: round(float(value) * 100, 2) for name, value in zip(classes, scores.mean(axis=0))},
+        'hotspots': [{
+            'x': tiles[i]['x'], 'y': tiles[i]['y'], 'width': tiles[i]['width'], 'height': tiles[i]['height'],
+            'label': classes[int(np.argmax(scores[i]))],
+            'score': round(float(scores[i].max()) * 100, 2)
+        } for i in order]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tiled inference over a large image (e.g. a drone orthomosaic saved as .npy)')
+    parser.add_argument('image', help='image file, or a .npy RGB uint8 array to memory-map')
+    parser.add_argument('--model', choices=['segmentation', 'tea_classifier'], default='segmentation')
+    parser.add_argument('--mask-out', help='write the stitched mask to this .npy file (memory-mapped)')
+    parser.add_argument('--tile', type=int, default=TILE_SIZE)
+    parser.add_argument('--overlap', type=float, default=TILE_OVERLAP)
+    args = parser.parse_args()
+
+    source = load_source(args.image)
+    if args.model == 'segmentation':
+        out = None
+        if args.mask_out:
+            channels = registry.get('segmentation').model.output_shape[-1]
+            out = np.lib.format.open_memmap(args.mask_out, mode='w+', dtype=np.uint8,
+                                            shape=source.shape[:2] + (channels,))
+        lesion_pixels = [0]
+
+        def count_lesions(y0, y1, band):
+            lesion_pixels[0] += int(np.count_nonzero(band[..., 0] > 127))
+
+        mask, tiles = segment_tiled(source, tile=args.tile, overlap=args.overlap, out=out, on_band=count_lesions)
+        classes = ['lesion'] if mask.shape[-1] == 1 else [f'class_{i}' for i in range(mask.shape[-1])]
+        summary = aggregate_tiles(tiles, classes)
+        summary['lesion_fraction'] = round(lesion_pixels[0] / float(source.shape[0] * source.shape[1]), 4)
+    else:
+        from tea_disease_classifier import CLASSES
+        summary = aggregate_tiles(classify_tiled(source, tile=args.tile, overlap=args.overlap), CLASSES)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,212 @@
+import time
+import bisect
+import threading
+import contextvars
+
+# Per-request stage timings and process-wide Prometheus metrics. Stages are timed
+# with `with tracing.stage('decode'):`; the histogram is always updated, and when a
+# request has a trace (tracing.start) the timing is also kept for its debug breakdown.
+
+# Clients send this header to get a 'timings' breakdown in the JSON response
+DEBUG_TIMING_HEADER = 'X-Debug-Timing'
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    """Prometheus histogram with fixed buckets and one series per label combination"""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = list(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+
+    def render(self):
+        with self._lock:
+            series = {key: {'counts': list(value['counts']), 'sum': value['sum']} for key, value in self._series.items()}
+        if not series:
+            # Nothing observed here; the model server's copy may be appended to the same scrape
+            return []
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for key, value in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], value['counts']):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {value['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter with one series per label combination"""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = dict(self._series)
+        if not series:
+            return []
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        for key, value in sorted(series.items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {value}')
+        return lines
+
+
+class Gauge:
+    """Prometheus gauge whose series are read from collect() -> {label values tuple: value} at scrape time"""
+
+    def __init__(self, name, description, labels=(), collect=None):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        series = self.collect() if self.collect else {}
+        if not series:
+            return []
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} gauge']
+        for key, value in sorted(series.items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {value}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time to handle an HTTP request', ['route', 'method', 'status'])
+STAGE_SECONDS = Histogram('pipeline_stage_duration_seconds', 'Time spent in each AI pipeline stage', ['stage'])
+MODEL_INFERENCE_SECONDS = Histogram('model_inference_duration_seconds', 'Forward pass time per batch', ['model'])
+MODEL_QUEUE_SECONDS = Histogram('model_queue_duration_seconds', 'Time a request waited for its batch to start', ['model'])
+MODEL_BATCH_SIZE = Histogram('model_batch_size', 'Images per forward pass', ['model'], BATCH_SIZE_BUCKETS)
+CACHE_LOOKUPS = Counter('pipeline_cache_lookups_total', 'Result cache lookups by the AI pipeline', ['result'])
+EARLY_EXITS = Counter('pipeline_early_exits_total', 'Pipeline stages skipped by an early exit', ['stage'])
+
+METRICS = [REQUEST_SECONDS, STAGE_SECONDS, MODEL_INFERENCE_SECONDS, MODEL_QUEUE_SECONDS, MODEL_BATCH_SIZE,
+           CACHE_LOOKUPS, EARLY_EXITS]
+
+
+def register(metric):
+    """Add a module's own metric to /metrics"""
+    METRICS.append(metric)
+    return metric
+
+
+def render_metrics():
+    """All metrics of this process in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return ''.join(line + '\n' for line in lines)
+
+
+class Trace:
+    """Stage durations, model batches and events of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.models = {}
+        self.events = {}
+
+    def add(self, name, seconds):
+        # A stage that runs more than once in a request (e.g. per image) accumulates
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def breakdown(self):
+        """The JSON 'timings' section: milliseconds per stage and per model call"""
+        return dict({
+            'totalMs': round((time.perf_counter() - self.started) * 1000, 2),
+            'stages': {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            'models': self.models
+        }, **self.events)
+
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+def start():
+    """Begin a trace for the current request (thread) and return it"""
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+
+def current():
+    return _current.get()
+
+
+class stage:
+    """Context manager timing one pipeline stage into the histogram and the current trace"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def record_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+def record_model(stage_name, model, future, seconds):
+    """Time a stage's model call took end to end, plus the batch it rode in (see BatchingPredictor)"""
+    record_stage(stage_name, seconds)
+    trace = _current.get()
+    if trace is not None:
+        trace.models[stage_name] = {
+            'model': model,
+            'ms': round(seconds * 1000, 2),
+            'batchSize': getattr(future, 'batch_size', None),
+            'queueMs': round(future.queue_seconds * 1000, 2) if hasattr(future, 'queue_seconds') else None
+        }
+
+
+def mark(key, value):
+    """Note an event (cache hit, early exit, ...) on the current trace"""
+    trace = _current.get()
+    if trace is not None:
+        trace.events[key] = value
+
+
+def debug_requested(request):
+    return request.headers.get(DEBUG_TIMING_HEADER, '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,217 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+
+# Gemini API configuration. GEMINI_API_URL can point at a local stub (see gemini_stub.py).
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', 'ds2323423424-24-3-4-34-')
+GEMINI_API_URL = os.getenv('GEMINI_API_URL', f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={GEMINI_API_KEY}")
+
+# Client limits: requests in flight, per-attempt timeout, retries and circuit breaker
+GEMINI_MAX_IN_FLIGHT = int(os.getenv('GEMINI_MAX_IN_FLIGHT', '4'))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv('GEMINI_TIMEOUT_SECONDS', '30'))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '2'))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+GEMINI_BREAKER_COOLDOWN_SECONDS = float(os.getenv('GEMINI_BREAKER_COOLDOWN_SECONDS', '60'))
+
+TREATMENT_UNAVAILABLE = "Treatment recommendations unavailable. Please consult with agricultural extension services for specific treatment advice."
+
+# Status codes worth retrying; anything else is treated as a final answer
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TreatmentClient:
+    """Pooled Gemini client with bounded concurrency, jittered retries and a circuit breaker"""
+
+    def __init__(self, api_url=GEMINI_API_URL, max_in_flight=GEMINI_MAX_IN_FLIGHT,
+                 timeout=GEMINI_TIMEOUT_SECONDS, max_retries=GEMINI_MAX_RETRIES,
+                 breaker_threshold=GEMINI_BREAKER_THRESHOLD, breaker_cooldown=GEMINI_BREAKER_COOLDOWN_SECONDS,
+                 fallback=TREATMENT_UNAVAILABLE):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.fallback = fallback
+
+        # One keep-alive pool sized to the in-flight limit
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._latencies = deque(maxlen=500)
+        self.calls = 0
+        self.failures = 0
+        self.fallbacks = 0
+        self.retries = 0
+
+    def get_treatment(self, disease, severity, region=None):
+        """Return the API's treatment text, or the local fallback when the API is unavailable"""
+        self.calls += 1
+        try:
+            probe = self._check_breaker()
+        except CircuitOpenError:
+            self.fallbacks += 1
+            return self.fallback
+
+        try:
+            # Waiting for a slot is bounded by the same timeout as the request itself
+            if not self._in_flight.acquire(timeout=self.timeout):
+                print("Gemini API busy: too many requests in flight")
+                self.fallbacks += 1
+                return self.fallback
+            try:
+                treatment = self._request_with_retries(disease, severity, region)
+            finally:
+                self._in_flight.release()
+
+            if treatment is None:
+                self._record_failure()
+                self.fallbacks += 1
+                return self.fallback
+            self._record_success()
+            return treatment
+        finally:
+            if probe:
+                with self._lock:
+                    self._probing = False
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.breaker_cooldown:
+                return 'half-open'
+            return 'open'
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(q):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+
+        return {
+            'state': self.state(),
+            'calls': self.calls,
+            'failures': self.failures,
+            'fallbacks': self.fallbacks,
+            'retries': self.retries,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1.0)}
+        }
+
+    def _check_breaker(self):
+        """Raise CircuitOpenError unless the request may go out; True when it is the half-open probe"""
+        state = self.state()
+        if state == 'open':
+            raise CircuitOpenError()
+        if state == 'closed':
+            return False
+        # Half-open: a single probe request goes out and its result closes or reopens
+        # the circuit; everything else keeps failing fast until it returns
+        with self._lock:
+            if self._probing:
+                raise CircuitOpenError()
+            self._probing = True
+        return True
+
+    def _record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.breaker_threshold:
+                if self._opened_at is None:
+                    print(f"Gemini API circuit opened after {self._consecutive_failures} failures")
+                self._opened_at = time.monotonic()
+
+    def _request_with_retries(self, disease, severity, region=None):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # Full jitter on an exponential backoff keeps retries from synchronising
+                self.retries += 1
+                time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+            retryable, treatment = self._request(disease, severity, region)
+            if treatment is not None or not retryable:
+                return treatment
+        return None
+
+    def _request(self, disease, severity, region=None):
+        """One API call; returns (retryable, treatment or None)"""
+        region_note = f"\n        The tea is grown in {region}; adapt products and timing to that region." if region else ''
+        prompt = f"""
+        Provide detailed treatment recommendations for tea leaf disease: {disease} with severity level: {severity}.{region_note}
+
+        Please include:
+        1. Specific fungicides or treatments with exact concentrations
+        2. Application frequency and timing
+        3. Cultural practices (spacing, pruning, drainage)
+        4. Preventive measures
+        5. Monitoring guidelines
+
+        Make the response practical and actionable for tea farmers. Focus on proven agricultural practices.
+        """
+
+        payload = {
+            "contents": [{
+                "parts": [{
+                    "text": prompt
+                }]
+            }]
+        }
+
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"Error calling Gemini API: {str(e)}")
+            return True, None
+        finally:
+            self._latencies.append(time.monotonic() - start)
+
+        if response.status_code == 200:
+            try:
+                result = response.json()
+            except ValueError:
+                print("Gemini API returned invalid JSON")
+                return True, None
+            try:
+                treatment = result['candidates'][0]['content']['parts'][0]['text'].strip()
+            except (KeyError, IndexError, TypeError, AttributeError) as e:
+                # Valid JSON of the wrong shape: a final answer, but not a treatment
+                print(f"Unexpected Gemini response shape: {type(e).__name__}: {str(e)}")
+                return False, None
+            if not treatment:
+                print("Empty treatment in Gemini response")
+                return False, None
+            return False, treatment
+
+        print(f"Gemini API error: {response.status_code} - {response.text}")
+        return response.status_code in RETRYABLE_STATUS, None
+
+
+# Shared by every caller in the process so the connection pool and limits are global
+default_client = TreatmentClient()
+
+
+def get_treatment_from_gemini(disease, severity, region=None):
+    """Get treatment recommendations from Gemini API based on disease, severity and optionally the growing region"""
+    return default_client.get_treatment(disease, severity, region)
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from treatment_client import default_client, get_treatment_from_gemini, TREATMENT_UNAVAILABLE
+
+# Treatment knowledge index: a versioned SQLite file built offline (python treatment_store.py build)
+# and read into memory once per process, so step 4 is a dict lookup. The API is only used
+# off the request path: for pairs missing from the index and to refresh stale entries.
+# The default path is next to this file, whatever directory the service is started from
+TREATMENT_STORE_PATH = os.getenv('TREATMENT_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'treatments.sqlite3'))
+TREATMENT_MAX_AGE_SECONDS = float(os.getenv('TREATMENT_MAX_AGE_SECONDS', str(7 * 24 * 3600)))
+# Regional variants kept next to the generic advice, e.g. "Assam,Darjeeling,Kenya"
+TREATMENT_REGIONS = [region.strip() for region in os.getenv('TREATMENT_REGIONS', '').split(',') if region.strip()]
+# Set to 0 to serve the index as built, without any API calls from the service
+TREATMENT_ENRICH = os.getenv('TREATMENT_ENRICH', '1') == '1'
+
+DISEASE_CLASSES = ['Algal Leaf Spot', 'Grey Blight Disease', 'Brown Blight', 'Red Leaf Spot', 'White Spot']
+SEVERITY_CLASSES = ['Mild', 'Moderate', 'Severe']
+
+# The generic (not region-specific) advice is stored under this region
+GENERIC_REGION = ''
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS treatments (
+    disease TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    region TEXT NOT NULL DEFAULT '',
+    treatment TEXT NOT NULL,
+    source TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (disease, severity, region)
+) WITHOUT ROWID;
+'''
+
+
+class TreatmentStore:
+    """(disease, severity, region) -> treatment index, answered from memory with background enrichment"""
+
+    def __init__(self, path=TREATMENT_STORE_PATH, max_age_seconds=TREATMENT_MAX_AGE_SECONDS, fetch=None,
+                 regions=TREATMENT_REGIONS, enrich=TREATMENT_ENRICH):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.fetch = fetch or get_treatment_from_gemini
+        self.regions = list(regions)
+        self.enrich = enrich
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.meta, self._entries = self._load()
+
+    def region_for(self, region):
+        """The stored variant a client's region maps to; unknown regions get the generic advice"""
+        return region if region in self.regions else GENERIC_REGION
+
+    def get(self, disease, severity, region=GENERIC_REGION):
+        """Return the indexed treatment at once; a missing pair gets the fallback and is fetched in the background"""
+        region = self.region_for(region)
+        key = (disease, severity, region)
+        entry = self._entries.get(key)
+        if entry is None and region != GENERIC_REGION:
+            # No regional variant yet: serve the generic advice while the variant is fetched
+            self._refresh_in_background(key)
+            entry = self._entries.get((disease, severity, GENERIC_REGION))
+            key = (disease, severity, GENERIC_REGION)
+        if entry is not None:
+            self.hits += 1
+            if time.time() - entry[1] > self.max_age_seconds:
+                self._refresh_in_background(key)
+            return entry[0]
+
+        self.misses += 1
+        self._refresh_in_background(key)
+        return TREATMENT_UNAVAILABLE
+
+    def refresh(self, disease, severity, region=GENERIC_REGION, source='enrichment'):
+        """Fetch a fresh treatment and index it unless the API fell back"""
+        treatment = self.fetch(disease, severity, region or None)
+        if treatment != TREATMENT_UNAVAILABLE:
+            self._put(disease, severity, region, treatment, source)
+        return treatment
+
+    def warm(self, diseases=DISEASE_CLASSES, severities=SEVERITY_CLASSES, regions=None, force=False):
+        """Fill every (disease, severity, region) entry ahead of time; returns the entries still missing"""
+        missing = []
+        for region in [GENERIC_REGION] + list(self.regions if regions is None else regions):
+            for disease in diseases:
+                for severity in severities:
+                    if force or (disease, severity, region) not in self._entries:
+                        if self.refresh(disease, severity, region, source='build') == TREATMENT_UNAVAILABLE:
+                            missing.append((disease, severity, region))
+        return missing
+
+    def validate(self, diseases=DISEASE_CLASSES, severities=SEVERITY_CLASSES):
+        """Problems that make the index unfit to serve: missing or empty entries for any class pair"""
+        problems = []
+        for region in [GENERIC_REGION] + self.regions:
+            for disease in diseases:
+                for severity in severities:
+                    entry = self._entries.get((disease, severity, region))
+                    label = f"{disease} ({severity}{', ' + region if region else ''})"
+                    if entry is None:
+                        problems.append(f'{label}: missing')
+                    elif not entry[0].strip() or entry[0] == TREATMENT_UNAVAILABLE:
+                        problems.append(f'{label}: no usable treatment text')
+        return problems
+
+    def build(self, force=False):
+        """Fill the index, then stamp a new version once it validates; returns the validation problems"""
+        self.warm(force=force)
+        problems = self.validate()
+        if not problems:
+            version = int(self.meta.get('version', '0')) + 1
+            self._set_meta({'version': str(version), 'built_at': str(time.time()),
+                            'regions': json.dumps(self.regions)})
+        return problems
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'version': int(self.meta.get('version', '0')),
+            'entries': len(self._entries),
+            'regions': self.regions,
+            'hits': self.hits,
+            'misses': self.misses,
+            'background_refreshes': self.refreshes
+        }
+
+    def _refresh_in_background(self, key):
+        if not self.enrich:
+            return
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.refreshes += 1
+
+        def run():
+            try:
+                self.refresh(*key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f'treatment-refresh-{"|".join(key)}', daemon=True).start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _load(self):
+        try:
+            conn = self._connect()
+            try:
+                meta = dict(conn.execute('SELECT key, value FROM meta'))
+                rows = conn.execute('SELECT disease, severity, region, treatment, updated_at FROM treatments')
+                entries = {(disease, severity, region): (treatment, updated_at)
+                           for disease, severity, region, treatment, updated_at in rows}
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Treatment index unavailable: {str(e)}")
+            return {}, {}
+        return meta, entries
+
+    def _put(self, disease, severity, region, treatment, source):
+        updated_at = time.time()
+        with self._lock:
+            self._entries[(disease, severity, region)] = (treatment, updated_at)
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO treatments VALUES (?, ?, ?, ?, ?, ?)',
+                                 (disease, severity, region, treatment, source, updated_at))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Treatment index write failed: {str(e)}")
+
+    def _set_meta(self, values):
+        self.meta.update(values)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', values.items())
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build, validate or inspect the treatment knowledge index')
+    parser.add_argument('command', nargs='?', choices=['build', 'validate', 'stats'], default='stats')
+    parser.add_argument('--force', action='store_true', help='refetch entries that are already indexed')
+    parser.add_argument('--api-url', help='override GEMINI_API_URL, e.g. a local gemini_stub.py server')
+    parser.add_argument('--stub', action='store_true', help='build against an in-process gemini_stub.py server')
+    parser.add_argument('--regions', nargs='*', help='regional variants to index (default: TREATMENT_REGIONS)')
+    parser.add_argument('--path', default=TREATMENT_STORE_PATH)
+    args = parser.parse_args()
+
+    if args.stub:
+        from gemini_stub import start_stub_server
+        _, args.api_url = start_stub_server()
+    if args.api_url:
+        default_client.api_url = args.api_url
+
+    store = TreatmentStore(path=args.path, regions=TREATMENT_REGIONS if args.regions is None else args.regions,
+                           enrich=False)
+    if args.command == 'stats':
+        print(json.dumps(store.stats(), indent=2))
+        sys.exit(0)
+
+    problems = store.build(force=args.force) if args.command == 'build' else store.validate()
+    for problem in problems:
+        print(f"Invalid: {problem}")
+    if problems:
+        sys.exit(1)
+    print(f"Treatment index {args.path} version {store.stats()['version']}: {store.stats()['entries']} entries valid")